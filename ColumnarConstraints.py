@@ -0,0 +1,211 @@
+"""
+Columnar evaluation of constraints over a batch of request contexts.
+
+The contexts of a batch are turned into one NumPy column per left operand: numbers as floats,
+ISO datetimes as epoch microseconds and other strings as codes of the batch's distinct values.
+Strings are compared as written, like ArithmeticConstraint.check_constraint does. A constraint is then evaluated
+once per batch as a boolean mask instead of once per request.
+"""
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import numpy as np
+
+from .Constraint import ArithmeticConstraint, LogicalConstraint, parse_datetime
+
+# Column kinds
+NUMBER = "number"
+DATETIME = "datetime"
+STRING = "string"
+OBJECT = "object"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+# Operators applied as array comparisons, per column kind; other operators are evaluated once
+# per distinct value
+_ORDERED = {
+    "eq": np.equal,
+    "neq": np.not_equal,
+    "gt": np.greater,
+    "gteq": np.greater_equal,
+    "lt": np.less,
+    "lteq": np.less_equal,
+}
+_VECTORIZED = {
+    NUMBER: _ORDERED,
+    DATETIME: _ORDERED,
+    STRING: {"eq": np.equal, "neq": np.not_equal},
+}
+
+_MISSING = object()
+
+
+def epoch_microseconds(value):
+    """
+    Parses an ISO 8601 datetime into microseconds since the epoch.
+
+    :param value: String such as "2024-02-01T00:00:00Z"; datetimes without an offset are taken as UTC.
+    :return: Integer microseconds, or None if the value is not an ISO datetime.
+    """
+    # Parsed like right operands and request values are by ArithmeticConstraint
+    parsed = parse_datetime(value) if isinstance(value, str) else None
+    return None if parsed is None else (parsed - _EPOCH) // _MICROSECOND
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Column:
+    __slots__ = ("kind", "values", "present", "raw", "codes")
+
+    def __init__(self, kind: str, values: np.ndarray, present: np.ndarray, raw: list, codes: dict = None):
+        """
+        Initializes a Column, the values one left operand has across a batch of contexts.
+
+        :param kind: NUMBER, DATETIME, STRING or OBJECT.
+        :param values: Encoded values; entries of contexts without the operand are undefined.
+        :param present: Boolean array, True where the context has a value for the operand.
+        :param raw: The values as given, _MISSING where absent, for operators evaluated per value.
+        :param codes: Optional; dictionary of string -> code the values of a STRING column are encoded with.
+        """
+        self.kind = kind
+        self.values = values
+        self.present = present
+        self.raw = raw
+        self.codes = codes
+
+    def encode(self, value):
+        """
+        Encodes a right operand like the values of the column.
+
+        :param value: Right operand of a constraint, as coerced by ArithmeticConstraint.compile.
+        :return: The encoded scalar, or None if it cannot be compared in the column's encoding.
+        """
+        if self.kind == NUMBER:
+            return float(value) if _is_number(value) or isinstance(value, Decimal) else None
+        if self.kind == DATETIME:
+            # A string operand is compared as text, not as a datetime, by check_constraint
+            return (value - _EPOCH) // _MICROSECOND if isinstance(value, datetime) else None
+        if self.kind == STRING:
+            return self.codes.get(value, -1) if isinstance(value, str) else None  # -1: no context has it
+        return None
+
+
+def build_column(values: list) -> Column:
+    """
+    Builds the column of one left operand.
+
+    :param values: The operand's value in every context, _MISSING where it has none.
+    :return: Column with the narrowest encoding that holds every present value.
+    """
+    present = np.fromiter((v is not _MISSING for v in values), dtype=bool, count=len(values))
+    given = [v for v in values if v is not _MISSING]
+    if given and all(_is_number(v) for v in given):
+        encoded = np.array([v if v is not _MISSING else np.nan for v in values], dtype=np.float64)
+        return Column(NUMBER, encoded, present, values)
+    if given and all(isinstance(v, str) for v in given):
+        instants = [epoch_microseconds(v) for v in given]
+        if all(i is not None for i in instants):
+            instants = iter(instants)
+            encoded = np.array([next(instants) if v is not _MISSING else 0 for v in values], dtype=np.int64)
+            return Column(DATETIME, encoded, present, values)
+        codes = {}
+        encoded = np.array([codes.setdefault(v, len(codes)) if v is not _MISSING else -1 for v in values],
+                           dtype=np.int64)
+        return Column(STRING, encoded, present, values, codes)
+    return Column(OBJECT, np.empty(0), present, values)
+
+
+class ContextColumns:
+    def __init__(self, contexts: list):
+        """
+        Initializes ContextColumns over a batch of request contexts.
+
+        Columns are built on first use, so only the left operands the evaluated constraints refer
+        to are converted.
+
+        :param contexts: List of dictionaries of left operand (full IRI or local name) -> value;
+                         None is taken as an empty context.
+        """
+        self.contexts = [context or {} for context in contexts]
+        self.size = len(self.contexts)
+        self._columns = {}
+
+    def column(self, constraint: ArithmeticConstraint) -> Column:
+        """
+        Returns the column of a constraint's left operand, looked up in each context like
+        ArithmeticConstraint.satisfied_by does: by full left operand, then by its local name.
+
+        :param constraint: ArithmeticConstraint.
+        :return: Column of the left operand.
+        """
+        key = (constraint.leftOperand, constraint.left_name)
+        column = self._columns.get(key)
+        if column is None:
+            left, name = key
+            column = build_column([c.get(left, c.get(name, _MISSING)) for c in self.contexts])
+            self._columns[key] = column
+        return column
+
+    def evaluate(self, constraint) -> np.ndarray:
+        """
+        Evaluates a constraint against every context of the batch.
+
+        :param constraint: ArithmeticConstraint or LogicalConstraint.
+        :return: Boolean array with one entry per context, as satisfied_by would return for it.
+        """
+        if isinstance(constraint, ArithmeticConstraint):
+            return self.__arithmetic(constraint)
+        if isinstance(constraint, LogicalConstraint):
+            return self.__logical(constraint)
+        return np.zeros(self.size, dtype=bool)
+
+    def evaluate_all(self, constraints) -> np.ndarray:
+        """
+        Evaluates the conjunction of constraints against every context of the batch.
+
+        :param constraints: Iterable of constraints, e.g. the constraints of a rule.
+        :return: Boolean array, True where every constraint is satisfied.
+        """
+        mask = np.ones(self.size, dtype=bool)
+        for constraint in constraints:
+            mask &= self.evaluate(constraint)
+        return mask
+
+    def __arithmetic(self, constraint):
+        column = self.column(constraint)
+        comparison = _VECTORIZED.get(column.kind, {}).get(constraint.operator_name)
+        if comparison is not None:
+            right = column.encode(constraint.right_value)
+            if right is not None:
+                return comparison(column.values, right) & column.present
+        return self.__per_value(constraint, column)
+
+    def __per_value(self, constraint, column):
+        # Operators without an array form are evaluated once per distinct value of the column
+        mask = np.zeros(self.size, dtype=bool)
+        results = {}
+        for position in np.flatnonzero(column.present):
+            value = column.raw[position]
+            try:
+                result = results.get(value)
+            except TypeError:  # Unhashable value, e.g. a list
+                mask[position] = constraint.check_constraint(constraint.leftOperand, value)
+                continue
+            if result is None:
+                result = results[value] = bool(constraint.check_constraint(constraint.leftOperand, value))
+            mask[position] = result
+        return mask
+
+    def __logical(self, constraint):
+        masks = [self.evaluate(member) for member in constraint.constraints]
+        if constraint.operator == 'or':
+            return np.logical_or.reduce(masks) if masks else np.zeros(self.size, dtype=bool)
+        elif constraint.operator == 'xone':
+            return np.sum(masks, axis=0) == 1 if masks else np.zeros(self.size, dtype=bool)
+        elif constraint.operator in ('and', 'andSequence'):
+            return np.logical_and.reduce(masks) if masks else np.ones(self.size, dtype=bool)
+        else:
+            return np.zeros(self.size, dtype=bool)
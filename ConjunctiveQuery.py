@@ -0,0 +1,327 @@
+"""
+Parser for the Datalog-style conjunctive queries used as rule targets, e.g.
+"q(x1,x3) <-- Table1(x1,'u8',x3,x4), Table2(x4,x5,x6)".
+
+Queries are parsed once per distinct string; the parsed structure is shared by the translators,
+the conflict checks and enforcement.
+"""
+import re
+from functools import lru_cache
+
+# Separators accepted between the head and the body of a query
+QUERY_SEPARATORS = (":-", "<--", "<-")
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<separator>:-|<--|<-)
+      | (?P<name>[A-Za-z_][\w.]*)
+      | (?P<number>-?\d+(?:\.\d+)?)
+      | (?P<string>'[^']*'|"[^"]*")
+      | (?P<punct>[(),.])
+    )""", re.VERBOSE)
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+def is_variable(term: str) -> bool:
+    """
+    Checks whether a query term is a variable; quoted strings and numbers are constants.
+
+    :param term: Term as written in the query.
+    :return: True for identifiers such as "x1".
+    """
+    return term[:1].isalpha() or term[:1] == "_"
+
+
+class Atom:
+    __slots__ = ("predicate", "args")
+
+    def __init__(self, predicate: str, args: tuple):
+        """
+        Initializes an Atom, predicate(arg, ...).
+
+        :param predicate: Predicate name, e.g. "Table1".
+        :param args: Tuple of terms as written in the query, e.g. ("x1", "'u8'").
+        """
+        self.predicate = predicate
+        self.args = tuple(args)
+
+    @property
+    def variables(self) -> tuple:
+        return tuple(a for a in self.args if is_variable(a))
+
+    def __eq__(self, other):
+        return isinstance(other, Atom) and other.predicate == self.predicate and other.args == self.args
+
+    def __hash__(self):
+        return hash((self.predicate, self.args))
+
+    def __str__(self):
+        return f"{self.predicate}({','.join(self.args)})"
+
+    def __repr__(self):
+        return f"Atom({self.predicate!r}, {self.args!r})"
+
+
+class ConjunctiveQuery:
+    __slots__ = ("head", "body")
+
+    def __init__(self, head: Atom, body: tuple):
+        """
+        Initializes a ConjunctiveQuery, head :- atom, atom, ...
+
+        :param head: Head atom; its arguments are the distinguished variables.
+        :param body: Tuple of body atoms.
+        """
+        self.head = head
+        self.body = tuple(body)
+
+    @property
+    def name(self) -> str:
+        return self.head.predicate
+
+    @property
+    def variables(self) -> frozenset:
+        return frozenset(v for atom in (self.head,) + self.body for v in atom.variables)
+
+    def __eq__(self, other):
+        return isinstance(other, ConjunctiveQuery) and other.head == self.head and other.body == self.body
+
+    def __hash__(self):
+        return hash((self.head, self.body))
+
+    def __str__(self):
+        return f"{self.head} :- {', '.join(str(atom) for atom in self.body)}"
+
+    def __repr__(self):
+        return f"ConjunctiveQuery({str(self)!r})"
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if match is None:
+            raise QuerySyntaxError(f"Unexpected character {text[position:].lstrip()[:1]!r} at {position} in {text!r}")
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+        position = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.tokens = _tokenize(text)
+        self.position = 0
+
+    def __peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def __expect(self, kind, value=None):
+        token_kind, token_value = self.__peek()
+        if token_kind != kind or (value is not None and token_value != value):
+            found = "end of query" if token_kind is None else repr(token_value)
+            raise QuerySyntaxError(f"Expected {value or kind} but found {found} in {self.text!r}")
+        self.position += 1
+        return token_value
+
+    def __atom(self):
+        predicate = self.__expect("name")
+        self.__expect("punct", "(")
+        args = []
+        if self.__peek() != ("punct", ")"):
+            while True:
+                kind, value = self.__peek()
+                if kind not in ("name", "number", "string"):
+                    found = "end of query" if kind is None else repr(value)
+                    raise QuerySyntaxError(f"Expected a term but found {found} in {self.text!r}")
+                self.position += 1
+                args.append(value)
+                if self.__peek() != ("punct", ","):
+                    break
+                self.position += 1
+        self.__expect("punct", ")")
+        return Atom(predicate, args)
+
+    def parse(self):
+        head = self.__atom()
+        self.__expect("separator")
+        body = [self.__atom()]
+        while self.__peek() == ("punct", ","):
+            self.position += 1
+            body.append(self.__atom())
+        if self.__peek() == ("punct", "."):
+            self.position += 1
+        if self.position != len(self.tokens):
+            raise QuerySyntaxError(f"Unexpected {self.__peek()[1]!r} after the query body in {self.text!r}")
+        return ConjunctiveQuery(head, body)
+
+
+def is_query(text) -> bool:
+    """
+    Checks whether a target is written as a conjunctive query rather than an IRI.
+
+    :param text: Target string.
+    :return: True if the string contains a head/body separator.
+    """
+    return isinstance(text, str) and any(separator in text for separator in QUERY_SEPARATORS)
+
+
+@lru_cache(maxsize=8192)
+def parse_query(text: str) -> ConjunctiveQuery:
+    """
+    Parses a conjunctive query; the result is memoized per query string.
+
+    :param text: Query such as "q(x1,x3) <-- Table1(x1,'u8',x3,x4), Table2(x4,x5,x6)".
+    :return: ConjunctiveQuery instance.
+    :raises QuerySyntaxError: If the string is not a well-formed query.
+    """
+    return _Parser(text).parse()
+
+
+def query_target(target):
+    """
+    Returns the parsed query of a target.
+
+    :param target: Target IRI or query string.
+    :return: ConjunctiveQuery instance, or None if the target is not a well-formed query.
+    """
+    if is_query(target):
+        try:
+            return parse_query(target)
+        except QuerySyntaxError:
+            pass
+    return None
+
+
+def canonical_target(target):
+    """
+    Returns the form a target is compared in: queries are normalized, other targets are unchanged.
+
+    :param target: Target IRI or query string.
+    :return: The target, with a query rewritten as "head :- atom, atom".
+    """
+    query = query_target(target)
+    return target if query is None else str(query)
+
+
+def _match_atom(atom: Atom, candidate: Atom, mapping: dict):
+    """
+    Extends a variable mapping so that it maps an atom onto a candidate atom.
+
+    :return: Dictionary of the newly bound variables, or None if the atoms cannot be unified.
+    """
+    added = {}
+    for term, value in zip(atom.args, candidate.args):
+        if is_variable(term):
+            bound = mapping.get(term, added.get(term))
+            if bound is None:
+                added[term] = value
+            elif bound != value:
+                return None
+        elif term != value:
+            return None
+    return added
+
+
+def _join_order(atoms, candidates, bound):
+    # Most constrained atom first: few candidate atoms, and connected to variables already bound,
+    # so the search fails early instead of enumerating cross products
+    ordered = []
+    bound = set(bound)
+    remaining = list(atoms)
+    while remaining:
+        atom = min(remaining, key=lambda a: (not bound.intersection(a.variables), len(candidates[a]),
+                                             -len(bound.intersection(a.variables))))
+        remaining.remove(atom)
+        ordered.append(atom)
+        bound.update(atom.variables)
+    return ordered
+
+
+@lru_cache(maxsize=65536)
+def find_homomorphism(source: ConjunctiveQuery, target: ConjunctiveQuery):
+    """
+    Finds a homomorphism from one query to another: a mapping of the source's variables to terms
+    of the target that maps the source head onto the target head and every source body atom onto a
+    target body atom. Results are memoized per pair of queries.
+
+    :param source: Query whose variables are mapped.
+    :param target: Query the variables are mapped into.
+    :return: Sorted tuple of (variable, term) pairs, or None if there is no homomorphism.
+    """
+    if len(source.head.args) != len(target.head.args):
+        return None
+    mapping = _match_atom(source.head, target.head, {})
+    if mapping is None:
+        return None
+
+    by_signature = {}
+    for atom in target.body:
+        by_signature.setdefault((atom.predicate, len(atom.args)), []).append(atom)
+    candidates = {atom: by_signature.get((atom.predicate, len(atom.args)), []) for atom in source.body}
+    if not all(candidates.values()):
+        return None
+    ordered = _join_order(set(source.body), candidates, mapping)
+
+    def search(depth):
+        if depth == len(ordered):
+            return True
+        atom = ordered[depth]
+        for candidate in candidates[atom]:
+            added = _match_atom(atom, candidate, mapping)
+            if added is None:
+                continue
+            mapping.update(added)
+            if search(depth + 1):
+                return True
+            for variable in added:
+                del mapping[variable]
+        return False
+
+    if not search(0):
+        return None
+    return tuple(sorted(mapping.items()))
+
+
+def is_contained(query: ConjunctiveQuery, container: ConjunctiveQuery) -> bool:
+    """
+    Checks whether every answer of a query is also an answer of another query.
+
+    By the homomorphism theorem this holds exactly when the container maps onto the query.
+
+    :param query: The contained candidate, e.g. a requested query.
+    :param container: The containing candidate, e.g. the target of a prohibition.
+    :return: True if query is contained in container.
+    """
+    return find_homomorphism(container, query) is not None
+
+
+def is_equivalent(first: ConjunctiveQuery, second: ConjunctiveQuery) -> bool:
+    """
+    Checks whether two queries have the same answers on every database.
+
+    :return: True if each query is contained in the other.
+    """
+    return is_contained(first, second) and is_contained(second, first)
+
+
+def target_covered(requested, granted) -> bool:
+    """
+    Checks whether a requested target is covered by the target of a rule.
+
+    :param requested: Target IRI or query string of a request.
+    :param granted: Target IRI or query string of a rule.
+    :return: True if the targets are equal or the requested query is contained in the rule's query.
+    """
+    if requested == granted:
+        return True
+    requested_query = query_target(requested)
+    granted_query = query_target(granted)
+    if requested_query is None or granted_query is None:
+        return False
+    return is_contained(requested_query, granted_query)
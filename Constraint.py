@@ -6,8 +6,219 @@ Description: This is the constraint package which has logical and arithmetic con
 Contributors:
 
 """
+import operator as _operator
+import re
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache, total_ordering
+
+from .Vocabulary import get_class_hierarchy
+from .iri_helper import expand, local_name
+
+_MISSING = object()
+
+_NUMBER = re.compile(r"^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$")
+_QUANTITY = re.compile(r"^([+-]?(?:\d+(?:\.\d*)?|\.\d+))\s*([A-Za-z%][\w/%]*)$")
+_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+
+@lru_cache(maxsize=65536)
+def parse_datetime(text: str):
+    """
+    Parses an ISO 8601 date or datetime; values without an offset are taken as UTC.
+
+    :param text: String such as "2024-02-01T00:00:00Z" or "2024-02-01".
+    :return: Timezone-aware datetime, or None if the string is not an ISO date.
+    """
+    if not _DATE.match(text):
+        return None
+    if text.endswith(("Z", "z")):  # Python 3.10's fromisoformat does not accept the Z suffix
+        text = text[:-1] + "+00:00"
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+
+@total_ordering
+class Quantity:
+    __slots__ = ("value", "unit")
+
+    def __init__(self, value: Decimal, unit: str):
+        """
+        Initializes a Quantity, an amount with a unit such as 10.0 EUR.
+
+        Quantities only compare with quantities of the same unit; comparing different units raises
+        TypeError, which makes the constraint unsatisfied.
+
+        :param value: Decimal amount.
+        :param unit: Unit IRI or symbol.
+        """
+        self.value = value
+        self.unit = unit
+
+    def __eq__(self, other):
+        if not isinstance(other, Quantity):
+            return NotImplemented
+        return self.unit == other.unit and self.value == other.value
+
+    def __lt__(self, other):
+        if not isinstance(other, Quantity) or self.unit != other.unit:
+            raise TypeError(f"Cannot compare {self!r} with {other!r}")
+        return self.value < other.value
+
+    def __hash__(self):
+        return hash((self.value, self.unit))
+
+    def __repr__(self):
+        return f"Quantity({self.value!r}, {self.unit!r})"
+
+
+def _as_decimal(value):
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    if isinstance(value, str) and _NUMBER.match(value):
+        return Decimal(value)
+    return value
+
+
+def _as_datetime(value):
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        return value if parsed is None else parsed
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+class _as_quantity:
+    # A class rather than a closure, so compiled constraints can be pickled for worker processes
+    __slots__ = ("unit",)
+
+    def __init__(self, unit):
+        self.unit = unit
+
+    def __call__(self, value):
+        if isinstance(value, dict) and "@value" in value:
+            return Quantity(_as_decimal(value["@value"]), value.get("unit", self.unit))
+        if isinstance(value, str):
+            match = _QUANTITY.match(value)
+            if match:
+                return Quantity(Decimal(match.group(1)), match.group(2))
+        value = _as_decimal(value)
+        return Quantity(value, self.unit) if isinstance(value, (int, Decimal)) and not isinstance(value, bool) else value
+
+
+def _items(value):
+    if isinstance(value, (str, bytes, dict)) or not hasattr(value, "__iter__"):
+        return frozenset((value,))
+    return value if isinstance(value, frozenset) else frozenset(value)
+
+
+def _is_a(value, right):
+    # Subsumption against the materialized DPV/ODRL class hierarchy
+    value_type = getattr(value, "type", value)
+    if value_type == right:
+        return True
+    if not isinstance(value_type, str) or not isinstance(right, str):
+        return False
+    # The hierarchy is keyed by full IRIs, while either side may be compact ("dpv:Employee")
+    return get_class_hierarchy().is_subclass(expand(value_type), expand(right))
+
+
+def _identity(value):
+    return value
+
+
+# Operator local name -> test(value, coerced right operand)
+COMPARISON_OPERATORS = {
+    "eq": _operator.eq,
+    "neq": _operator.ne,
+    "gt": _operator.gt,
+    "gteq": _operator.ge,
+    "lt": _operator.lt,
+    "lteq": _operator.le,
+}
+
+
+def _is_subset(value, right):
+    return _items(value) <= right
+
+
+def _is_superset(value, right):
+    return right <= _items(value)
+
+
+def _intersects(value, right):
+    return not _items(value).isdisjoint(right)
+
+
+def _is_disjoint(value, right):
+    return _items(value).isdisjoint(right)
+
+
+# Named functions rather than lambdas, so compiled constraints can be pickled
+SET_OPERATORS = {
+    "hasPart": _is_subset,
+    "isPartOf": _is_superset,
+    "isAllOf": _is_subset,
+    "isAnyOf": _intersects,
+    "isNoneOf": _is_disjoint,
+}
+OPERATORS = dict(COMPARISON_OPERATORS, isA=_is_a, **SET_OPERATORS)
+
+
+def coerce_operand(value, unit=None, datatype=None):
+    """
+    Coerces a right operand to the type it is compared as.
+
+    JSON-LD value objects are unwrapped; ISO dates become timezone-aware datetimes, numbers and
+    numeric strings Decimals, amounts with a unit (a unit argument, or strings such as "10.0EUR")
+    Quantities, and lists frozensets. Other values are returned unchanged.
+
+    :param value: Right operand as parsed from JSON.
+    :param unit: Optional; unit of the constraint.
+    :param datatype: Optional; datatype of the constraint, e.g. "xsd:dateTime".
+    :return: Tuple of the coerced operand and the function that coerces request values alike.
+    """
+    if isinstance(value, dict) and "@value" in value:
+        value, datatype = value["@value"], value.get("@type", datatype)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        try:
+            return frozenset(value), _identity
+        except TypeError:
+            return value, _identity
+    if unit is not None:
+        quantity = _as_quantity(unit)(value)
+        if isinstance(quantity, Quantity):
+            return quantity, _as_quantity(unit)
+    if isinstance(value, str):
+        kind = local_name(datatype).rpartition(":")[2] if isinstance(datatype, str) else None  # e.g. "xsd:date"
+        if kind in (None, "dateTime", "date", "dateTimeStamp"):
+            parsed = parse_datetime(value)
+            if parsed is not None:
+                return parsed, _as_datetime
+        if _NUMBER.match(value):
+            return Decimal(value), _as_decimal
+        match = _QUANTITY.match(value)
+        if match:
+            return Quantity(Decimal(match.group(1)), match.group(2)), _as_quantity(match.group(2))
+        return value, _identity
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return _as_decimal(value), _as_decimal
+    if isinstance(value, datetime):
+        return _as_datetime(value), _as_datetime
+    return value, _identity
+
 
 class Constraint:
+    def __new__(cls, leftOperand=None, operator=None, rightOperand=None, **args):
+        # Constraint(...) builds the concrete constraint, so parsed constraints can be evaluated
+        if cls is Constraint:
+            cls = LogicalConstraint if leftOperand is None else ArithmeticConstraint
+        return super().__new__(cls)
+
     def __init__(self, leftOperand=None, operator=None, rightOperand=None, **args):
         if leftOperand is None:
             LogicalConstraint.__init__(self,**args)
@@ -24,43 +235,57 @@ class Refinement(Constraint):
         pass
 
 class ArithmeticConstraint(Constraint):
-    def __init__(self, leftOperand, operator, rightOperand):
+    def __init__(self, leftOperand, operator, rightOperand, **args):
         self.operator = operator
         self.leftOperand = leftOperand  # The specific operand that needs an exact match to proceed
         self.rightOperand = rightOperand
+        self.unit = args.get("unit")
+        self.dataType = args.get("dataType")
+        # Local names resolved once at parse time, e.g. "eq" for "http://www.w3.org/ns/odrl/2/eq"
+        self.left_name = local_name(leftOperand) if isinstance(leftOperand, str) else leftOperand
+        self.right_name = local_name(rightOperand) if isinstance(rightOperand, str) else rightOperand
+        self.compile()
+
+    def compile(self):
+        """
+        Resolves the operator to its test and coerces the right operand, so check_constraint does
+        no string dispatch or parsing of the right operand. Call it again after changing the
+        operator or the right operand.
+        """
+        operator = self.operator.get("@id") if isinstance(self.operator, dict) else self.operator
+        self.operator_name = local_name(expand(operator)) if isinstance(operator, str) else operator
+        self._test = OPERATORS.get(self.operator_name) if isinstance(self.operator_name, str) else None
+        if self.operator_name == "isA":
+            self.right_value, self._coerce = self.rightOperand, _identity
+        elif self.operator_name in SET_OPERATORS:
+            right = self.rightOperand
+            right = right if isinstance(right, (list, tuple, set, frozenset)) else [right]
+            self.right_value, self._coerce = coerce_operand(right)
+        else:
+            self.right_value, self._coerce = coerce_operand(self.rightOperand, self.unit, self.dataType)
 
     def check_constraint(self, leftOperandValue, value):
         # First, check if the leftOperand matches exactly
         if self.leftOperand is not None and self.leftOperand != leftOperandValue:
             return False  # The leftOperand does not match; constraint check does not proceed
+        if self._test is None:
+            return False
+        try:
+            return self._test(self._coerce(value), self.right_value)
+        except (TypeError, ValueError, InvalidOperation):  # Values of incomparable types
+            return False
 
-        # Proceed with the constraint checks
-        if self.operator == 'eq':
-            return value == self.rightOperand
-        elif self.operator == 'gt':
-            return value > self.rightOperand
-        elif self.operator == 'gteq':
-            return value >= self.rightOperand
-        elif self.operator == 'lt':
-            return value < self.rightOperand
-        elif self.operator == 'lteq':
-            return value <= self.rightOperand
-        elif self.operator == 'neq':
-            return value != self.rightOperand
-        elif self.operator == "isA":  # This will require OWL reasoning for completeness.
-            return value.type == self.rightOperand
-        elif self.operator == "hasPart":
-            return all(item in self.rightOperand for item in value)
-        elif self.operator == "isPartOf":
-            return all(item in value for item in self.rightOperand)
-        elif self.operator == "isAllOf":
-            return all(item == self.rightOperand for item in value)
-        elif self.operator == "isAnyOf":
-            return any(item == self.rightOperand for item in value)
-        elif self.operator == "isNoneOf":
-            return all(item != self.rightOperand for item in value)
-        else:
+    def satisfied_by(self, context: dict) -> bool:
+        """
+        Checks the constraint against the value its left operand has in a request context.
+
+        :param context: Dictionary of left operand (full IRI or local name, e.g. "dateTime") -> value.
+        :return: True if the context has a value for the left operand that satisfies the constraint.
+        """
+        value = context.get(self.leftOperand, context.get(self.left_name, _MISSING))
+        if value is _MISSING:
             return False
+        return self.check_constraint(self.leftOperand, value)
 
 class LogicalConstraint(Constraint):
     def __init__(self, **args):
@@ -69,17 +294,48 @@ class LogicalConstraint(Constraint):
         self.logic_xone = args.get("xone", None)
         self.logic_andSequence = args.get("andSequence", None)
 
+        # The logical operator and its operand constraints, for evaluation
+        self.operator = None
+        self.constraints = []
+        for operator in ("and", "or", "xone", "andSequence"):
+            members = args.get(operator)
+            if members is not None:
+                self.operator = operator
+                if isinstance(members, dict):  # JSON-LD list object, or a single constraint
+                    members = members.get("@list", [members])
+                # References to constraints defined elsewhere ({"@id": ...}) cannot be evaluated here
+                self.constraints = [c if isinstance(c, Constraint) else Constraint(**c) for c in members
+                                    if isinstance(c, Constraint) or (isinstance(c, dict) and set(c) - {"@id"})]
+                break
+
         #super().__init__(**args)
 
     def check_constraint(self, value):
         if self.operator == 'or':
-            return any(constraint.check_constraint(None, value) for constraint in self.constraints)
-        elif self.operator == '':
-            return sum(constraint.check_constraint(None, value) for constraint in self.constraints) == 1
+            return any(constraint.check_constraint(constraint.leftOperand, value) for constraint in self.constraints)
+        elif self.operator == 'xone':
+            return sum(constraint.check_constraint(constraint.leftOperand, value) for constraint in self.constraints) == 1
         elif self.operator == 'and':
-            return all(constraint.check_constraint(None, value) for constraint in self.constraints)
+            return all(constraint.check_constraint(constraint.leftOperand, value) for constraint in self.constraints)
         elif self.operator == 'andSequence':
-            results = [constraint.check_constraint(None, value) for constraint in self.constraints]
+            results = [constraint.check_constraint(constraint.leftOperand, value) for constraint in self.constraints]
             return all(results) and results == sorted(results, reverse=True)
+        else:
+            return False
+
+    def satisfied_by(self, context: dict) -> bool:
+        """
+        Checks the operand constraints against a request context and combines the results.
+
+        :param context: Dictionary of left operand (full IRI or local name) -> value.
+        :return: True if the combination of the operand constraints is satisfied.
+        """
+        results = [constraint.satisfied_by(context) for constraint in self.constraints]
+        if self.operator == 'or':
+            return any(results)
+        elif self.operator == 'xone':
+            return sum(results) == 1
+        elif self.operator in ('and', 'andSequence'):
+            return all(results)
         else:
             return False
\ No newline at end of file
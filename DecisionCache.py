@@ -0,0 +1,168 @@
+"""
+Cache of enforcement decisions, keyed by the normalized request.
+
+Entries are tagged with the target they were decided for, so a policy change only invalidates
+the decisions of the targets its rules refer to, and with the policy-set version, so a decision
+computed before a change is never stored after it.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from .ConjunctiveQuery import canonical_target, is_query
+from .iri_helper import expand
+
+# Returned by DecisionCache.get on a miss; None is a valid decision
+MISS = object()
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return frozenset((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
+
+def target_key(target):
+    """
+    Returns the form a target is compared in by the cache: expanded and, for queries, canonical.
+
+    :param target: Target IRI or query string.
+    :return: The normalized target.
+    """
+    target = canonical_target(target)
+    return expand(target) if isinstance(target, str) else target
+
+
+def request_key(action, target, assigner, assignee=None, context=None, normalize: bool = True):
+    """
+    Returns the normalized form of a request, under which its decision is cached.
+
+    Compact IRIs are expanded, query targets canonicalized and the context turned into a hashable
+    value, so requests that differ only in how they are written share an entry.
+
+    :param normalize: Whether to expand and canonicalize the terms; pass False when the decision
+                      is made by comparing the terms as written.
+    :return: Hashable tuple, or None if the context holds values that cannot be hashed.
+    """
+    if normalize:
+        action, target, assigner, assignee = (expand(term) if isinstance(term, str) else term
+                                              for term in (action, target_key(target), assigner, assignee))
+    key = (action, target, assigner, assignee, _freeze(context))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+class DecisionCache:
+    def __init__(self, max_size: int = 65536, ttl: float = None):
+        """
+        Initializes a DecisionCache.
+
+        :param max_size: Maximum number of entries; the least recently used one is evicted first.
+        :param ttl: Optional; seconds an entry is served for. Set it when policies have constraints
+                    on the current time, so decisions are recomputed as time passes.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidated = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns a cached decision.
+
+        :param key: Key returned by request_key.
+        :return: The decision (which may be None), or MISS.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            decision, expires, _ = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return decision
+
+    def put(self, key, decision, version, ttl: float = None):
+        """
+        Stores a decision, evicting the least recently used entries above max_size.
+
+        :param key: Key returned by request_key.
+        :param decision: The decision.
+        :param version: Policy-set version the decision was computed against; the decision is not
+                        stored if the policies changed since.
+        :param ttl: Optional; overrides the cache's ttl for this entry.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = (decision, expires, (key[1], is_query(key[1])))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, version, targets=None, queries: bool = False):
+        """
+        Moves the cache to a new policy-set version and drops the decisions it makes stale.
+
+        :param version: The new policy-set version.
+        :param targets: Optional; targets of the changed rules, expanded and canonical as in the keys
+                        of request_key. Without it every entry is dropped.
+        :param queries: Whether a changed rule has a query target, which can cover any requested query.
+        """
+        with self._lock:
+            self.version = version
+            if targets is None:
+                stale = list(self._entries)
+            else:
+                targets = set(targets)
+                stale = [key for key, (_, _, (target, query)) in self._entries.items()
+                         if target in targets or (queries and query)]
+            for key in stale:
+                del self._entries[key]
+            self.invalidated += len(stale)
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+
+        :return: Dictionary with version, size, hits, misses, expired, invalidated and hit_ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"version": self.version, "size": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "expired": self.expired, "invalidated": self.invalidated,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        """
+        Drops every entry and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.expired = 0
+            self.invalidated = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -8,10 +8,47 @@ Contributors:
 """
 from typing import Union, Optional
 
-from .Refinables import Action
+from .Refinables import Action, Refinable
 from .Refinables import AssetCollection
 from .Refinables import PartyCollection
 from .Constraint import Constraint
+from .ConjunctiveQuery import canonical_target, is_query, query_target
+from .iri_helper import expand, iri_id
+
+
+def _expand(iri):
+    return None if iri is None else expand(iri)
+
+
+def term_iri(term):
+    """
+    Returns the IRI a rule or request term refers to, in the expanded form the interner stores.
+
+    :param term: A plain string, a Refinable, or a dictionary describing a party or asset.
+    :return: The expanded IRI (the canonical form for a query), or None if the term is not set.
+    """
+    if term is None:
+        return None
+    if isinstance(term, str):
+        return _expand(canonical_target(term))
+    if isinstance(term, dict):
+        return _expand(canonical_target(term.get("uid", term.get("source"))))
+    source = getattr(term, "source", None)
+    if is_query(source):  # Query targets are matched on their parsed form, not their spelling
+        return _expand(canonical_target(source))
+    if not isinstance(term, Refinable):
+        return None
+    return _expand(source if source is not None else getattr(term, "uid", None))
+
+
+def term_id(term):
+    """
+    Returns the interned id of the IRI a rule term refers to.
+
+    :param term: A plain string, a Refinable, or a dictionary describing a party or asset.
+    :return: The integer id, or None if the term is not set.
+    """
+    return iri_id(term_iri(term))
 
 class Rule:
     def __init__(self, action: Action = None, target: AssetCollection = None, assigner: Union[PartyCollection, None] = None, assignee: Union[PartyCollection, None] = None, constraint: list[Union[Constraint, 'LogicalConstraint']] = None, uid: str = None):
@@ -57,9 +94,36 @@ class Rule:
         elif isinstance(constraint, dict):
             self.constraint = [Constraint(**constraint)]
 
+        # Parsed query of a query target, which also covers requests for queries it contains
+        self.target_query = query_target(self.target if isinstance(self.target, str) else getattr(self.target, "source", None))
+
         self.type = type
         self.uid = uid
         self.state = "Inactive"  # Default state is Inactive
+        self.fingerprint = None  # (kind, content hash), stored by PolicyIR.rule_fingerprint
+
+    def actions(self) -> list:
+        """
+        Returns the actions of the Rule as a list.
+
+        :return: List of action terms, empty if the Rule has no action.
+        """
+        if isinstance(self.action, list):
+            return self.action
+        return [] if self.action is None else [self.action]
+
+    def refresh_ids(self):
+        """
+        Interns the target, assigner, assignee and actions of the Rule, so enforcement compares
+        integers instead of IRI strings. Only PolicyEnforcement.reindex calls it, for the rules it
+        enforces, so parsed policies that are never enforced do not grow the process-wide interner.
+        """
+        self.target_id = term_id(self.target)
+        self.target_query = query_target(self.target if isinstance(self.target, str) else getattr(self.target, "source", None))
+        self.assigner_id = term_id(self.assigner)
+        self.assignee_id = term_id(self.assignee)
+        self.action_ids = tuple(term_id(a) for a in self.actions())
+        self.fingerprint = None  # The terms may have changed since it was computed
 
     def add_constraint(self, constraint: Union[Constraint, 'LogicalConstraint']):
         """
@@ -3,13 +3,292 @@ from datetime import datetime
 
 from .Parsers import ODRLParser
 from .Refinables import Action
-from .Policy import Policy, Permission, Prohibition, Obligation, Duty
+from .Policy import Policy, Permission, Prohibition, Obligation, Duty, term_iri
+from .ColumnarConstraints import ContextColumns
+from .ConjunctiveQuery import is_contained, query_target
+from .DecisionCache import MISS, DecisionCache, request_key
+from .PolicyIR import policy_fingerprint
+from .Vocabulary import ClassHierarchy
+from .iri_helper import UNKNOWN_ID, interner
+
+
+def _conditions(rule):
+    # An ex:query constraint defines the target rather than a condition on the request
+    return [c for c in rule.constraint
+            if hasattr(c, "satisfied_by") and getattr(c, "leftOperand", None) != "ex:query"]
+
+
+# The policy-set digest is the sum of the policies' sha256 fingerprints modulo 2**256
+_DIGEST_MODULUS = 1 << 256
+
+# Requested actions whose granted action keys are cached; the cache is cleared when it is full
+_MAX_ACTION_KEYS = 65536
+
+
+def _recompile(constraint):
+    if hasattr(constraint, "compile"):
+        constraint.compile()
+    for member in getattr(constraint, "constraints", ()):
+        _recompile(member)
+
+
+def _remove(index, keys, rule):
+    # Removes a rule from a nested index and prunes the dictionaries it leaves empty
+    path = [index]
+    for key in keys[:-1]:
+        path.append(path[-1].get(key))
+        if path[-1] is None:
+            return
+    rules = path[-1].get(keys[-1])
+    if rules is None:
+        return
+    rules[:] = [r for r in rules if r is not rule]
+    if not rules:
+        del path[-1][keys[-1]]
+        for depth in range(len(keys) - 1, 0, -1):
+            if path[depth]:
+                break
+            del path[depth - 1][keys[depth - 1]]
+
+
+def _prepare(policy):
+    # Interns the terms of the enforced rules, which only happens here, and compiles their constraints
+    for attribute in ("permission", "prohibition"):
+        for rule in getattr(policy, attribute):
+            rule.refresh_ids()
+            for constraint in rule.constraint:
+                _recompile(constraint)
 
 
 class PolicyEnforcement:
-    def __init__(self, policies: List[Policy]):
+    def __init__(self, policies: List[Policy], hierarchy: ClassHierarchy = None, cache: DecisionCache = None):
+        """
+        Initializes a PolicyEnforcement instance.
+
+        :param policies: The policies to enforce.
+        :param hierarchy: Optional; class hierarchy used to match an assignee or action against a
+                          rule stated for one of its superclasses. Without it, terms must match exactly.
+        :param cache: Optional; cache of the decisions of enforce_policy. Defaults to a DecisionCache
+                      without ttl; pass one with a ttl when constraints depend on the current time.
+        """
         self.policies = policies
+        self.hierarchy = hierarchy
+        self.cache = DecisionCache() if cache is None else cache
+        self.reindex()
+
+    def reindex(self):
+        """
+        Rebuilds the rule indexes from self.policies; call it after changing the policies in place.
+
+        The terms of every rule are interned again and its arithmetic constraints recompiled, so
+        edits of targets, parties, actions, operators and right operands take effect. Rules are
+        indexed as target id -> action id -> assigner id -> rules, so a check only looks at the
+        rules stated for the requested target, action and assigner. Rules with a query target are
+        indexed as action id -> assigner id -> rules and matched by query containment.
+        Every cached decision is dropped.
+        """
+        self._permission_index = ({}, {})
+        self._prohibition_index = ({}, {})
+        self._fingerprints = {}
+        self._digest = 0
+        for policy in self.policies:
+            _prepare(policy)
+            self.__index(policy)
+        self.__indexed()
+        self.cache.invalidate(self.version)
+
+    def __index(self, policy):
+        # Adds the rules of a policy to the indexes and its fingerprint to the policy-set digest
+        for attribute, (exact, queries) in (("permission", self._permission_index),
+                                            ("prohibition", self._prohibition_index)):
+            for rule in getattr(policy, attribute):
+                for action_id in set(rule.action_ids):
+                    if rule.target_query is not None:
+                        by_assigner = queries.setdefault(action_id, {})
+                    else:
+                        by_assigner = exact.setdefault(rule.target_id, {}).setdefault(action_id, {})
+                    by_assigner.setdefault(rule.assigner_id, []).append(rule)
+        fingerprint = int(policy_fingerprint(policy), 16)
+        self._fingerprints[id(policy)] = fingerprint
+        self._digest = (self._digest + fingerprint) % _DIGEST_MODULUS
+
+    def __unindex(self, policy):
+        # Removes the rules of an indexed policy and its fingerprint, as recorded when it was indexed
+        for attribute, (exact, queries) in (("permission", self._permission_index),
+                                            ("prohibition", self._prohibition_index)):
+            for rule in getattr(policy, attribute):
+                for action_id in set(rule.action_ids):
+                    if rule.target_query is not None:
+                        _remove(queries, (action_id, rule.assigner_id), rule)
+                    else:
+                        _remove(exact, (rule.target_id, action_id, rule.assigner_id), rule)
+        self._digest = (self._digest - self._fingerprints.pop(id(policy))) % _DIGEST_MODULUS
+
+    def __indexed(self):
+        # The digest is a sum of per-policy fingerprints, so a change only hashes the changed policies
+        self.version = f"{self._digest:064x}"
+        self._action_keys = {}  # Superclasses of requested actions may have been interned since
+
+    def __changed(self, policies):
+        # Drops the cached decisions of the targets the changed rules refer to
+        self.__indexed()
+        rules = [rule for policy in policies for attribute in ("permission", "prohibition")
+                 for rule in getattr(policy, attribute)]
+        # The interned target is expanded and canonical, the form request_key stores, also for
+        # AssetCollection targets
+        self.cache.invalidate(self.version, {interner.iri(rule.target_id) for rule in rules},
+                              any(rule.target_query is not None for rule in rules))
+
+    def add_policy(self, policy: Policy):
+        """
+        Adds a policy to the enforced policies. Only the rules of the policy are indexed.
+
+        :param policy: Parsed Policy.
+        """
+        _prepare(policy)
+        self.policies = self.policies + [policy]
+        self.__index(policy)
+        self.__changed([policy])
+
+    def update_policy(self, policy: Policy):
+        """
+        Replaces the enforced policies that have the uid of a policy with that policy. Only the
+        rules of the replaced policies and of the policy are reindexed.
+
+        :param policy: Parsed Policy; it is added if no enforced policy has its uid.
+        """
+        _prepare(policy)
+        replaced = [p for p in self.policies if p.uid == policy.uid]
+        self.policies = [p for p in self.policies if p.uid != policy.uid] + [policy]
+        for old in replaced:
+            self.__unindex(old)
+        self.__index(policy)
+        self.__changed(replaced + [policy])
+
+    def remove_policy(self, uid):
+        """
+        Removes the enforced policies with a uid. Only their rules are removed from the indexes.
+
+        :param uid: Policy uid.
+        :return: List of the removed policies.
+        """
+        removed = [p for p in self.policies if p.uid == uid]
+        if removed:
+            self.policies = [p for p in self.policies if p.uid != uid]
+            for policy in removed:
+                self.__unindex(policy)
+            self.__changed(removed)
+        return removed
+
+    def __granted_action_keys(self, action: str):
+        # The requested action and, with a hierarchy, its superclasses: every rule action that covers it.
+        # Keyed by IRI, as an action no rule mentions has no id of its own but may still have superclasses
+        keys = self._action_keys.get(action)
+        if keys is None:
+            keys = [interner.lookup(action)]
+            if self.hierarchy is not None and action is not None:
+                for iri in self.hierarchy.ancestors(action):
+                    key = interner.lookup(iri)
+                    if key != UNKNOWN_ID and key not in keys:
+                        keys.append(key)
+            if len(self._action_keys) >= _MAX_ACTION_KEYS:
+                self._action_keys.clear()
+            self._action_keys[action] = keys
+        return keys
+
+    def _subsumed(self, requested: str, granted: int) -> bool:
+        """
+        Checks whether a requested term is covered by the term a rule is stated for.
+
+        :param requested: Expanded IRI of the term from the request.
+        :param granted: Interned id of the term from the rule.
+        :return: True if the terms are equal, or requested is a subclass of granted.
+        """
+        granted_iri = interner.iri(granted)
+        if requested == granted_iri:
+            return True
+        if self.hierarchy is None or granted_iri is None:
+            return False
+        return self.hierarchy.is_subclass(requested, granted_iri)
+
+    def _applies(self, rule, assignee: str, context: dict) -> bool:
+        """
+        Checks the parts of a candidate rule the indexes do not cover: the assignee and, when a
+        context is given, the constraints.
+
+        :param rule: Candidate rule.
+        :param assignee: Expanded IRI of the requested assignee, or None to accept any.
+        :param context: Request attributes, or None to skip the constraints.
+        :return: True if the rule applies to the request.
+        """
+        if assignee is not None and not self._subsumed(assignee, rule.assignee_id):
+            return False
+        if context is None:
+            return True
+        return all(c.satisfied_by(context) for c in _conditions(rule))
+
+    def __applies_in_batch(self, rule, position: int, request: dict, columns: ContextColumns, masks: dict) -> bool:
+        # Like _applies, with the constraints of each rule evaluated once for the whole batch
+        assignee = term_iri(request.get("assignee"))
+        if assignee is not None and not self._subsumed(assignee, rule.assignee_id):
+            return False
+        if request.get("context") is None:
+            return True
+        mask = masks.get(id(rule))
+        if mask is None:
+            mask = masks[id(rule)] = columns.evaluate_all(_conditions(rule))
+        return bool(mask[position])
 
+    def _rules_by_assigner(self, index, action: str, target_id: int, target_query) -> dict:
+        """
+        Returns the rules of an index whose target and action cover a request, by assigner id.
+
+        :param index: Index built by reindex.
+        :param action: Expanded IRI of the requested action.
+        :param target_id: Interned id of the requested target.
+        :param target_query: Parsed query of the requested target, or None if it is not a query.
+        :return: Dictionary of assigner id -> list of rules.
+        """
+        exact, queries = index
+        action_keys = self.__granted_action_keys(action)
+        rules = {}
+        by_action = exact.get(target_id)
+        if by_action is not None:
+            for key in action_keys:
+                for assigner_id, assigner_rules in by_action.get(key, {}).items():
+                    rules.setdefault(assigner_id, []).extend(assigner_rules)
+        if target_query is not None and queries:
+            for key in action_keys:
+                for assigner_id, assigner_rules in queries.get(key, {}).items():
+                    matched = [rule for rule in assigner_rules if is_contained(target_query, rule.target_query)]
+                    if matched:
+                        rules.setdefault(assigner_id, []).extend(matched)
+        return rules
+
+    def _candidates(self, index, action: str, target_id: int, target_query, assigner_id: int):
+        """
+        Yields the rules of an index whose target, action and assigner cover a request.
+
+        :param index: Index built by reindex.
+        :param action: Expanded IRI of the requested action.
+        :param target_id: Interned id of the requested target.
+        :param target_query: Parsed query of the requested target, or None if it is not a query.
+        :param assigner_id: Interned id of the requested assigner.
+        :return: Generator of rules; the assignee is not checked.
+        """
+        exact, queries = index
+        action_keys = self.__granted_action_keys(action)
+        by_action = exact.get(target_id)
+        if by_action is not None:
+            for key in action_keys:
+                by_assigner = by_action.get(key)
+                if by_assigner is not None:
+                    yield from by_assigner.get(assigner_id, ())
+        if target_query is not None and queries:
+            for key in action_keys:
+                for rule in queries.get(key, {}).get(assigner_id, ()):
+                    if is_contained(target_query, rule.target_query):
+                        yield rule
 
     # def check_permission(self, permission_list:List[Permission]) -> bool:
     #     """
@@ -30,7 +309,7 @@ class PolicyEnforcement:
     #                         if permission.action == perm.action:
     #                             return (policy.uid, True)
     #     return (policy.uid, False)
-    def check_permission(self, action: str, target: str, assigner: str, assignee: str = None) -> bool:
+    def check_permission(self, action: str, target: str, assigner: str, assignee: str = None, context: dict = None) -> bool:
         """
         Checks if the given action is permitted according to any of the policies.
 
@@ -38,21 +317,22 @@ class PolicyEnforcement:
         :param target: The target of the action.
         :param assigner: The entity attempting the action.
         :param assignee: Optional; the entity to whom the action is assigned.
+        :param context: Optional; request attributes constraints are checked against (left operand ->
+                        value). Without it, constraints are not checked.
         :return: True if the action is permitted, False otherwise.
         """
-        for policy in self.policies:
-            for permission in policy.permission:
-                if permission.target == target and permission.assigner == assigner:
-                    if assignee is None or permission.assignee == assignee:
-                        try:
-                            if any(act.title == action for act in permission.action):
-                                return True
-                        except:
-                            if permission.action == action:
-                                return True
+        # Hierarchy checks use the expanded request IRIs; the interner only serves the exact-match index
+        action = term_iri(action)
+        target_id = interner.lookup(term_iri(target))
+        target_query = query_target(target)
+        assigner_id = interner.lookup(term_iri(assigner))
+        assignee = term_iri(assignee)
+        for permission in self._candidates(self._permission_index, action, target_id, target_query, assigner_id):
+            if self._applies(permission, assignee, context):
+                return True
         return False
 
-    def check_prohibition(self, action: str, target: str, assigner: str, assignee: str = None) -> bool:
+    def check_prohibition(self, action: str, target: str, assigner: str, assignee: str = None, context: dict = None) -> bool:
         """
         Checks if the given action is prohibited according to any of the policies.
 
@@ -60,22 +340,23 @@ class PolicyEnforcement:
         :param target: The target of the action.
         :param assigner: The entity attempting the action.
         :param assignee: Optional; the entity to whom the action is assigned.
+        :param context: Optional; request attributes constraints are checked against (left operand ->
+                        value). Without it, constraints are not checked.
         :return: True if the action is prohibited, False otherwise.
         """
 
-        for policy in self.policies:
-            for prohibition in policy.prohibition:
-                if prohibition.target == target and prohibition.assigner == assigner:
-                    if assignee is None or prohibition.assignee == assignee:
-                        try:
-                            if any(act.title == action for act in prohibition.action):
-                                return True
-                        except:
-                            if prohibition.action == action:
-                                return True
+        # Hierarchy checks use the expanded request IRIs; the interner only serves the exact-match index
+        action = term_iri(action)
+        target_id = interner.lookup(term_iri(target))
+        target_query = query_target(target)
+        assigner_id = interner.lookup(term_iri(assigner))
+        assignee = term_iri(assignee)
+        for prohibition in self._candidates(self._prohibition_index, action, target_id, target_query, assigner_id):
+            if self._applies(prohibition, assignee, context):
+                return True
         return False
 
-    def enforce_policy(self, action: str, target: str, assigner: str, assignee: str = None) -> Union[str, None]:
+    def enforce_policy(self, action: str, target: str, assigner: str, assignee: str = None, context: dict = None) -> Union[str, None]:
         """
         Enforces the policies by checking if the given action is permitted, prohibited, or neither.
 
@@ -83,14 +364,60 @@ class PolicyEnforcement:
         :param target: The target of the action.
         :param assigner: The entity attempting the action.
         :param assignee: Optional; the entity to whom the action is assigned.
+        :param context: Optional; request attributes constraints are checked against.
         :return: "Permitted" if the action is permitted, "Prohibited" if the action is prohibited, None otherwise.
         """
-        if self.check_permission(action=action, target=target, assigner=assigner, assignee=assignee):
-            return "Permitted"
-        elif self.check_prohibition(action, target, assigner, assignee):
-            return "Prohibited"
+        key = request_key(action, target, assigner, assignee, context)
+        if key is not None:
+            decision = self.cache.get(key)
+            if decision is not MISS:
+                return decision
+        version = self.version
+        if self.check_permission(action=action, target=target, assigner=assigner, assignee=assignee, context=context):
+            decision = "Permitted"
+        elif self.check_prohibition(action, target, assigner, assignee, context):
+            decision = "Prohibited"
         else:
-            return None
+            decision = None
+        if key is not None:
+            self.cache.put(key, decision, version)
+        return decision
+
+    def enforce_many(self, requests: list) -> list:
+        """
+        Enforces the policies for many requests at once.
+
+        Requests are grouped by (target, action); the candidate rules of a group are looked up
+        once and shared by all of its requests. The request contexts are evaluated column-wise
+        (see ContextColumns), so the constraints of a rule are evaluated once for the whole batch.
+
+        :param requests: List of dictionaries with "action", "target", "assigner" and the optional
+                         "assignee" and "context" keys, as taken by enforce_policy.
+        :return: List of decisions ("Permitted", "Prohibited" or None), in the order of the requests.
+        """
+        decisions = [None] * len(requests)
+        columns = ContextColumns([request.get("context") for request in requests])
+        masks = {}
+        groups = {}
+        for position, request in enumerate(requests):
+            groups.setdefault((request.get("target"), request.get("action")), []).append(position)
+
+        for (target, action), positions in groups.items():
+            action = term_iri(action)
+            target_id = interner.lookup(term_iri(target))
+            target_query = query_target(target)
+            permissions = self._rules_by_assigner(self._permission_index, action, target_id, target_query)
+            prohibitions = self._rules_by_assigner(self._prohibition_index, action, target_id, target_query)
+            for position in positions:
+                request = requests[position]
+                assigner_id = interner.lookup(term_iri(request.get("assigner")))
+                if any(self.__applies_in_batch(rule, position, request, columns, masks)
+                       for rule in permissions.get(assigner_id, ())):
+                    decisions[position] = "Permitted"
+                elif any(self.__applies_in_batch(rule, position, request, columns, masks)
+                         for rule in prohibitions.get(assigner_id, ())):
+                    decisions[position] = "Prohibited"
+        return decisions
 
     # def enforce_policy(self, policy:Policy):
     #     """
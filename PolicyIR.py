@@ -0,0 +1,498 @@
+"""
+Typed intermediate representation of policy rules, shared by the logic and Rego translators.
+
+A parsed Policy is lowered into RuleIR objects once by PolicyCompiler; each translator is a
+renderer over the IR. Variables are numbered relative to their rule, and the running x numbering
+of a corpus is applied through the base offset of each RuleIR.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+
+from .ConjunctiveQuery import is_query, parse_query
+from .Refinables import AssetCollection, PartyCollection
+from .iri_helper import local_name
+
+logger = logging.getLogger(__name__)
+
+# Rule kinds in translation order, with the Policy attribute holding the rules of each kind
+RULE_KINDS = (("Prohibition", "prohibition"), ("Permission", "permission"), ("Obligation", "obligation"))
+
+
+def _term_source(term):
+    """
+    Returns the IRI or label a rule refers to for its target, assignee or action.
+
+    :param term: A plain string, a Refinable, or a list of Actions.
+    :return: The source string, or None if the rule does not set the term.
+    """
+    if term is None or isinstance(term, str):
+        return term
+    if isinstance(term, list):
+        return term[0].source if term else None
+    return term.source
+
+
+def _refinements(term):
+    """
+    Returns the refinements of a rule term as a list.
+
+    :param term: A plain string, a Refinable, or a list of Actions (whose first Action is used).
+    :return: List of constraints, empty if the term has none.
+    """
+    if isinstance(term, list):
+        term = term[0] if term else None
+    refinement = getattr(term, "refinement", None)
+    if refinement is None:
+        return []
+    return refinement if isinstance(refinement, list) else [refinement]
+
+
+def _constraint_operands(constraint):
+    """
+    Returns the (left operand, operator, right operand) local names of a constraint.
+
+    :param constraint: Arithmetic constraint, or logical constraint with an "and" list.
+    :return: List of name triples, one per arithmetic part.
+    """
+    if hasattr(constraint, "left_name"):
+        return [(constraint.left_name, constraint.operator_name, constraint.right_name)]
+    if getattr(constraint, "logic_and", None) is not None:
+        return [(local_name(a['leftOperand']), local_name(a['operator']), local_name(a['rightOperand']))
+                for a in constraint.logic_and]
+    return []
+
+
+def _canonical(value):
+    """
+    Converts a rule term into plain JSON-compatible data, independent of how it was parsed.
+
+    :param value: String, number, dictionary, list, Refinable or constraint.
+    :return: Nested lists, dictionaries and scalars.
+    """
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if hasattr(value, "other"):  # Refinables keep the arguments they were parsed from
+        return _canonical(value.other)
+    if hasattr(value, "leftOperand"):
+        return {"leftOperand": _canonical(value.leftOperand), "operator": _canonical(value.operator),
+                "rightOperand": _canonical(value.rightOperand), "unit": _canonical(getattr(value, "unit", None)),
+                "dataType": _canonical(getattr(value, "dataType", None))}
+    if hasattr(value, "target_query"):  # Duties nested in a rule
+        return _rule_content(value)
+    if hasattr(value, "logic_and"):
+        return {"and": _canonical(value.logic_and), "or": _canonical(value.logic_or),
+                "xone": _canonical(value.logic_xone), "andSequence": _canonical(value.logic_andSequence)}
+    return repr(value)
+
+
+def _rule_content(rule):
+    # Every part of a rule a decision can depend on, including its duties and their consequences
+    content = {"target": rule.target, "assigner": rule.assigner, "assignee": rule.assignee,
+               "action": rule.action, "constraint": rule.constraint}
+    for attribute in ("duty", "remedy", "consequence"):
+        if getattr(rule, attribute, None):
+            content[attribute] = getattr(rule, attribute)
+    return {name: _canonical(value) for name, value in content.items()}
+
+
+def rule_fingerprint(kind: str, rule) -> str:
+    """
+    Returns a content hash of a rule, equal for rules with the same terms, constraints and duties.
+
+    The hash is computed once per rule and stored in rule.fingerprint; Rule.refresh_ids, which
+    PolicyEnforcement.reindex calls after in-place edits, clears it.
+
+    :param kind: "Prohibition", "Permission" or "Obligation".
+    :param rule: Parsed Rule.
+    :return: Hex digest of the canonical JSON form of the rule.
+    """
+    stored = getattr(rule, "fingerprint", None)
+    if stored is not None and stored[0] == kind:
+        return stored[1]
+    canonical = [kind, _rule_content(rule)]
+    data = json.dumps(canonical, sort_keys=True, separators=(",", ":"), default=str)
+    fingerprint = hashlib.sha256(data.encode("utf-8")).hexdigest()
+    rule.fingerprint = (kind, fingerprint)
+    return fingerprint
+
+
+def policy_fingerprint(policy) -> str:
+    """
+    Returns a content hash of a policy: its uid and the fingerprints of its rules in order.
+
+    :param policy: Parsed Policy.
+    :return: Hex digest.
+    """
+    digest = hashlib.sha256(str(policy.uid).encode("utf-8"))
+    for kind, attribute in RULE_KINDS:
+        for rule in getattr(policy, attribute):
+            digest.update(rule_fingerprint(kind, rule).encode("ascii"))
+    return digest.hexdigest()
+
+
+class RuleId:
+    """
+    Placeholder for the id of the rule an atom belongs to, filled in when the rule is rendered.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        return "RULE_ID"  # Unpickles to the module's singleton, so "is RULE_ID" holds in other processes
+
+    def __repr__(self):
+        return "RULE_ID"
+
+
+RULE_ID = RuleId()
+
+
+class Variable:
+    __slots__ = ("index",)
+
+    def __init__(self, index: int):
+        """
+        Initializes a Variable.
+
+        :param index: Number of the variable relative to the first variable of its rule.
+        """
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, Variable) and other.index == self.index
+
+    def __hash__(self):
+        return hash(("Variable", self.index))
+
+    def __repr__(self):
+        return f"Variable({self.index})"
+
+
+class Relation:
+    __slots__ = ("name", "subject", "object")
+
+    def __init__(self, name: str, subject, object):
+        """
+        Initializes a Relation, the has<Name>(subject, object) atom.
+
+        :param name: Relation name, e.g. "target", "actor" or a constraint's left operand.
+        :param subject: RULE_ID or a Variable the relation starts from.
+        :param object: Variable, or the tuple of arguments of a conjunctive query head.
+        """
+        self.name = name
+        self.subject = subject
+        self.object = object
+
+    def __repr__(self):
+        return f"Relation({self.name!r}, {self.subject!r}, {self.object!r})"
+
+
+class QueryAtom:
+    __slots__ = ("predicate", "args")
+
+    def __init__(self, predicate: str, args: tuple):
+        """
+        Initializes a QueryAtom, a body atom of a conjunctive query target, Predicate(arg, ...).
+
+        :param predicate: Predicate name, e.g. "Table1".
+        :param args: Tuple of Variables and constants as written in the query, e.g. "'u8'".
+        """
+        self.predicate = predicate
+        self.args = args
+
+    def __repr__(self):
+        return f"QueryAtom({self.predicate!r}, {self.args!r})"
+
+
+class Membership:
+    __slots__ = ("class_name", "variable")
+
+    def __init__(self, class_name: str, variable: Variable):
+        """
+        Initializes a Membership, the ClassName(x) atom.
+
+        :param class_name: Display name of the class.
+        :param variable: Variable that belongs to the class.
+        """
+        self.class_name = class_name
+        self.variable = variable
+
+    def __repr__(self):
+        return f"Membership({self.class_name!r}, {self.variable!r})"
+
+
+class Comparison:
+    __slots__ = ("variable", "operator", "value")
+
+    def __init__(self, variable: Variable, operator: str, value):
+        """
+        Initializes a Comparison between a variable and a constant.
+
+        :param variable: Variable on the left-hand side.
+        :param operator: Local name of the ODRL operator, e.g. "lt".
+        :param value: Right operand.
+        """
+        self.variable = variable
+        self.operator = operator
+        self.value = value
+
+    def __repr__(self):
+        return f"Comparison({self.variable!r}, {self.operator!r}, {self.value!r})"
+
+
+class RuleIR:
+    __slots__ = ("kind", "id", "body", "span", "base")
+
+    def __init__(self, kind: str, id: str, body: list, span: int, base: int = 0):
+        """
+        Initializes a RuleIR, the compiled form of one rule.
+
+        :param kind: "Prohibition", "Permission" or "Obligation".
+        :param id: Rule id, e.g. "Pr1".
+        :param body: List of Relation, Membership, Comparison and QueryAtom conjuncts.
+        :param span: Number of variables the rule uses.
+        :param base: Number of the rule's first variable in the corpus.
+        """
+        self.kind = kind
+        self.id = id
+        self.body = body
+        self.span = span
+        self.base = base
+
+    def at(self, base: int, id: str = None):
+        """
+        Returns the same rule placed at another base offset; the body is shared.
+
+        :param base: Number of the rule's first variable in the corpus.
+        :param id: Optional; rule id to use instead of the current one.
+        :return: RuleIR instance.
+        """
+        return RuleIR(self.kind, id if id is not None else self.id, self.body, self.span, base)
+
+    def __repr__(self):
+        return f"RuleIR({self.kind!r}, {self.id!r}, span={self.span}, base={self.base})"
+
+
+class TranslationCache:
+    def __init__(self, max_size: int = 65536):
+        """
+        Initializes a TranslationCache of compiled rules.
+
+        Entries are keyed by the content hash of a rule and the version of the vocabulary it was
+        compiled against, so an unchanged rule is served from the cache even when other rules of
+        its policy changed, and an ontology release invalidates every entry at once. The cached
+        RuleIR is position independent; its id and base offset are set when it is placed.
+
+        :param max_size: Maximum number of entries; the least recently used one is evicted first.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns a cached compiled rule.
+
+        :param key: (rule fingerprint, vocabulary version) tuple.
+        :return: RuleIR instance, or None on a miss.
+        """
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return compiled
+
+    def put(self, key, compiled: RuleIR):
+        """
+        Stores a compiled rule, evicting the least recently used entries above max_size.
+
+        :param key: (rule fingerprint, vocabulary version) tuple.
+        :param compiled: RuleIR instance.
+        """
+        with self._lock:
+            self._entries[key] = compiled
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+
+        :return: Dictionary with size, hits, misses and hit_ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        """
+        Drops every entry and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+translation_cache = TranslationCache()
+
+
+class PolicyCompiler:
+    def __init__(self, vocabulary, cache: TranslationCache = None):
+        """
+        Initializes a PolicyCompiler.
+
+        :param vocabulary: Vocabulary snapshot actors and actions are resolved against.
+        :param cache: Optional; TranslationCache compiled rules are looked up in and stored to.
+        """
+        self.vocabulary = vocabulary
+        self.cache = cache
+
+    def compile(self, policies: list) -> list:
+        """
+        Compiles policies into RuleIR objects, numbering variables across the whole list.
+
+        :param policies: Parsed Policy objects.
+        :return: List of RuleIR in translation order.
+        """
+        return list(self.iter_compile(policies))
+
+    def iter_compile(self, policies):
+        """
+        Compiles policies lazily, yielding each RuleIR as soon as its rule is compiled.
+
+        Rule ids restart for every policy while variable numbers keep running. A rule that
+        cannot be compiled is reported and skipped; it still uses up its rule id.
+
+        :param policies: Iterable of parsed Policy objects.
+        :return: Generator of RuleIR in translation order.
+        """
+        base = 0
+        for policy in policies:
+            for compiled in self.iter_compile_policy(policy, base):
+                yield compiled
+                base = compiled.base + compiled.span
+
+    def compile_policy(self, policy, base: int = 0) -> list:
+        """
+        Compiles the rules of one policy.
+
+        :param policy: Parsed Policy.
+        :param base: Optional; number of the policy's first variable in the corpus.
+        :return: List of RuleIR in translation order.
+        """
+        return list(self.iter_compile_policy(policy, base))
+
+    def iter_compile_policy(self, policy, base: int = 0):
+        """
+        Compiles the rules of one policy lazily.
+
+        :param policy: Parsed Policy.
+        :param base: Optional; number of the policy's first variable in the corpus.
+        :return: Generator of RuleIR in translation order.
+        """
+        number = 1
+        for kind, attribute in RULE_KINDS:
+            for rule in getattr(policy, attribute):
+                try:
+                    compiled = self.__compile_cached(kind, number, rule)
+                except Exception:  # A malformed rule is skipped; the rest of the policy is still translated
+                    logger.exception("Could not compile %s %s of policy %s", kind, number, policy.uid)
+                else:
+                    yield compiled.at(base, f"{kind[:2]}{number}")
+                    base += compiled.span
+                number += 1
+
+    def __compile_cached(self, kind, number, rule):
+        if self.cache is None:
+            return self.compile_rule(kind, number, rule)
+        key = (rule_fingerprint(kind, rule), self.vocabulary.version)
+        compiled = self.cache.get(key)
+        if compiled is None:
+            compiled = self.compile_rule(kind, number, rule)
+            self.cache.put(key, compiled)
+        return compiled
+
+    def compile_rule(self, kind: str, number: int, rule) -> RuleIR:
+        """
+        Compiles one rule with its variables numbered from 0.
+
+        :param kind: "Prohibition", "Permission" or "Obligation".
+        :param number: Number of the rule within its policy.
+        :param rule: Parsed Rule.
+        :return: RuleIR instance.
+        """
+        subject = RULE_ID
+        body = []
+        n = 0
+
+        query = ""
+        for c in rule.constraint:
+            if getattr(c, "leftOperand", None) == "ex:query":
+                query = c.rightOperand
+        if query == "":
+            query = rule.target if isinstance(rule.target, str) else rule.target.source
+
+        if is_query(query):
+            # Query variables are renamed into the rule's own variables, so they cannot clash with
+            # the variables of the actor, action and constraints that follow
+            parsed = parse_query(query)
+            variables = {}
+            for atom in (parsed.head,) + parsed.body:
+                for term in atom.variables:
+                    if term not in variables:
+                        variables[term] = Variable(n + len(variables))
+            n += len(variables)
+            body.append(Relation("target", subject, tuple(variables.get(a, a) for a in parsed.head.args)))
+            body.extend(QueryAtom(atom.predicate, tuple(variables.get(a, a) for a in atom.args))
+                        for atom in parsed.body)
+        else:
+            refinements = _refinements(rule.target) if isinstance(rule.target, AssetCollection) else []
+            n = self.__term(body, "target", subject, local_name(query), refinements, n)
+
+        actor = self.vocabulary.actors.lookup(_term_source(rule.assignee))
+        if actor is not None:
+            refinements = _refinements(rule.assignee) if isinstance(rule.assignee, PartyCollection) else []
+            n = self.__term(body, "actor", subject, actor.name, refinements, n)
+
+        action = self.vocabulary.actions.lookup(_term_source(rule.action))
+        if action is not None:
+            n = self.__term(body, "action", subject, action.name, _refinements(rule.action), n)
+
+        for c in rule.constraint:
+            self.__constraint(body, subject, Variable(n), c)
+            n += 1
+        return RuleIR(kind, f"{kind[:2]}{number}", body, n)
+
+    def __term(self, body, name, subject, class_name, refinements, n):
+        variable = Variable(n)
+        body.append(Relation(name, subject, variable))
+        body.append(Membership(class_name, variable))
+        for ref in refinements:
+            n += 1
+            self.__constraint(body, variable, Variable(n), ref)
+        return n + 1
+
+    def __constraint(self, body, subject, variable, constraint):
+        for lo, op, ro in _constraint_operands(constraint):
+            body.append(Relation(lo, subject, variable))
+            if lo == "purpose" or op == "isA":
+                body.append(Membership(ro, variable))
+            else:
+                body.append(Comparison(variable, op, ro))
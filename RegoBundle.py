@@ -0,0 +1,256 @@
+"""
+Export of policies as an OPA bundle: one Rego v1 module per policy uid plus a .manifest.
+
+Rules are emitted as "allow if { ... }" / "deny if { ... }" with equality tests of input fields
+against constants, which OPA's rule indexer can use. Exports are incremental: the manifest
+records the fingerprints of every module's policies and the exporter version, and only modules
+whose fingerprints changed are rendered and written again.
+"""
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from .Constraint import ArithmeticConstraint, Quantity
+from .Policy import term_iri
+from .PolicyIR import RULE_KINDS, policy_fingerprint
+from .iri_helper import local_name
+
+# Root package of every exported module
+BUNDLE_ROOT = "policies"
+
+# Version of the rendered Rego; bump it when rendering changes, so every module is exported again
+EXPORTER_VERSION = "2"
+
+# Rego comparison per operator local name; other operators have no Rego counterpart here
+REGO_COMPARISONS = {
+    "eq": "==",
+    "gt": ">",
+    "gteq": ">=",
+    "lt": "<",
+    "lteq": "<=",
+    "neq": "!="
+}
+
+# Rego test per set operator; {items} is the set of items of the context value and {right} the
+# set of the right operand, as compared by ArithmeticConstraint
+REGO_SET_OPERATORS = {
+    "hasPart": "{items} - {right} == set()",
+    "isPartOf": "{right} - {items} == set()",
+    "isAllOf": "{items} - {right} == set()",
+    "isAnyOf": "count({items} & {right}) > 0",
+    "isNoneOf": "count({items} & {right}) == 0",
+}
+
+# Function the set operators use: a context value's items, a single value being its own item
+ITEMS_FUNCTION = [
+    "_items(value) := {item | some item in value} if is_array(value)",
+    "",
+    "_items(value) := {value} if not is_array(value)",
+]
+
+# Rule head per rule kind
+RULE_HEADS = {
+    "Permission": "allow",
+    "Prohibition": "deny",
+    "Obligation": "obligations contains {id}",
+}
+
+_NON_IDENTIFIER = re.compile(r"[^A-Za-z0-9_]+")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def package_name(uid) -> str:
+    """
+    Returns the Rego package of a policy uid, e.g. "policies.http_example_com_policy_001_1a2b3c4d".
+
+    The uid is reduced to ASCII letters, digits and underscores, and a short hash of the full uid
+    is appended, so uids that only differ in other characters (e.g. "p-1" and "p_1") stay apart.
+
+    :param uid: Policy uid.
+    :return: Dotted package name below BUNDLE_ROOT.
+    """
+    name = _NON_IDENTIFIER.sub("_", str(uid)).strip("_") or "policy"
+    if not name[0].isalpha():
+        name = f"p_{name}"
+    digest = hashlib.sha256(str(uid).encode("utf-8")).hexdigest()[:8]
+    return f"{BUNDLE_ROOT}.{name}_{digest}"
+
+
+def _rego_value(value) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def _context_ref(left_operand) -> str:
+    return f"input.context[{_rego_value(local_name(left_operand))}]"
+
+
+class RegoBundleExporter:
+    def __init__(self, directory: str):
+        """
+        Initializes a RegoBundleExporter.
+
+        :param directory: Bundle directory; it can be served or loaded with "opa run -b <directory>".
+        """
+        self.directory = directory
+
+    def render_module(self, uid, policies: list) -> str:
+        """
+        Renders the Rego module of the policies that share a uid.
+
+        Requests are evaluated against input.action, input.target, input.assigner, input.assignee
+        and input.context (a dictionary of constraint left operand local name -> value). A missing
+        input.assignee matches any assignee, as in PolicyEnforcement.
+
+        :param uid: Policy uid.
+        :param policies: Parsed Policy objects with that uid.
+        :return: Rego source.
+        """
+        lines = [f"package {package_name(uid)}", "", "import rego.v1", "",
+                 "default allow := false", "", "default deny := false"]
+        for policy in policies:
+            number = 1  # Numbered like the translators: Pr1, Pe2, ... in RULE_KINDS order
+            for kind, attribute in RULE_KINDS:
+                for rule in getattr(policy, attribute):
+                    rule_id = f"{kind[:2]}{number}"
+                    number += 1
+                    lines.append("")
+                    lines.append(f"# {rule_id}" + (f" {rule.uid}" if rule.uid else ""))
+                    lines.append(f"{RULE_HEADS[kind].format(id=_rego_value(rule_id))} if {{")
+                    lines.extend(f"\t{condition}" for condition in self.__conditions(rule))
+                    lines.append("}")
+        if any("_items(" in line for line in lines):
+            lines.extend(["", *ITEMS_FUNCTION])
+        return "\n".join(lines) + "\n"
+
+    def __conditions(self, rule):
+        conditions = [self.__equals("input.target", term_iri(rule.target)),
+                      self.__equals("input.assigner", term_iri(rule.assigner))]
+        assignee = term_iri(rule.assignee)
+        if assignee is None:
+            conditions.append("not input.assignee")
+        else:
+            conditions.append(f"object.get(input, \"assignee\", {_rego_value(assignee)}) == {_rego_value(assignee)}")
+        actions = sorted({a for a in (term_iri(a) for a in rule.actions()) if a is not None})
+        if len(actions) == 1:
+            conditions.append(self.__equals("input.action", actions[0]))
+        elif actions:
+            conditions.append(f"input.action in {{{', '.join(_rego_value(a) for a in actions)}}}")
+        elif rule.actions():
+            conditions.append("not input.action")
+        for constraint in rule.constraint:
+            if hasattr(constraint, "satisfied_by") and getattr(constraint, "leftOperand", None) != "ex:query":
+                conditions.extend(self.__constraint(constraint))
+        return conditions
+
+    def __equals(self, ref, value):
+        return f"not {ref}" if value is None else f"{ref} == {_rego_value(value)}"
+
+    def __comparison(self, constraint):
+        # operator_name and right_value are the operator and right operand ArithmeticConstraint.compile
+        # resolved, so the export compares the types enforce_policy compares
+        value, right = _context_ref(constraint.leftOperand), constraint.right_value
+        test = REGO_SET_OPERATORS.get(constraint.operator_name)
+        if test is not None:
+            items = sorted(_rego_value(item) for item in right)
+            return test.format(items=f"_items({value})", right=f"{{{', '.join(items)}}}" if items else "set()")
+        comparison = REGO_COMPARISONS.get(constraint.operator_name)
+        if comparison is None:
+            return f"false # operator {constraint.operator} is not supported in Rego export"
+        if isinstance(right, datetime):
+            nanoseconds = (right - _EPOCH) // timedelta(microseconds=1) * 1000
+            return f"time.parse_rfc3339_ns({value}) {comparison} {nanoseconds}"
+        if isinstance(right, Decimal):
+            return f"to_number({value}) {comparison} {right}"
+        if isinstance(right, Quantity):
+            return "false # quantities with a unit are not supported in Rego export"
+        return f"{value} {comparison} {_rego_value(right)}"
+
+    def __constraint(self, constraint):
+        if isinstance(constraint, ArithmeticConstraint):
+            return [self.__comparison(constraint)]
+        if constraint.operator in ("and", "andSequence"):
+            return [comparison for member in constraint.constraints for comparison in self.__constraint(member)]
+        if constraint.operator in ("or", "xone"):
+            return ["false # or/xone constraints are not supported in Rego export"]
+        return []
+
+    def __manifest_path(self):
+        return os.path.join(self.directory, ".manifest")
+
+    def __module_path(self, uid):
+        # Relative to the bundle directory, as recorded in the manifest
+        return "/".join([*package_name(uid).split("."), "policy.rego"])
+
+    def __write(self, path, text):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(text)
+        os.replace(temp_path, path)
+
+    def read_manifest(self) -> dict:
+        """
+        Reads the manifest of the bundle directory.
+
+        :return: Manifest dictionary, empty if the bundle was never exported.
+        """
+        try:
+            with open(self.__manifest_path(), encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def export(self, policies: list) -> dict:
+        """
+        Writes the bundle, rendering only the modules whose policies changed.
+
+        A module is unchanged when the fingerprints of its policies and EXPORTER_VERSION match
+        the manifest of the previous export; it is then neither rendered nor written.
+
+        :param policies: Parsed Policy objects; policies sharing a uid go into one module.
+        :return: Dictionary with the uids "written", "unchanged" and "removed".
+        :raises ValueError: If two uids map to the same Rego package.
+        """
+        groups = {}
+        for policy in policies:
+            groups.setdefault(str(policy.uid), []).append(policy)
+        packages = {}
+        for uid in groups:
+            other = packages.setdefault(package_name(uid), uid)
+            if other != uid:
+                raise ValueError(f"Policies {other!r} and {uid!r} map to the same Rego package {package_name(uid)}")
+        hashes = {uid: hashlib.sha256("".join(policy_fingerprint(p) for p in group).encode("ascii")).hexdigest()
+                  for uid, group in groups.items()}
+        paths = {uid: self.__module_path(uid) for uid in groups}
+
+        metadata = self.read_manifest().get("metadata", {})
+        current = metadata.get("exporter") == EXPORTER_VERSION
+        previous = metadata.get("policies", {})
+        previous_paths = metadata.get("modules", {})
+        result = {"written": [], "unchanged": [], "removed": []}
+        for uid, group in groups.items():
+            path = os.path.join(self.directory, paths[uid])
+            if current and previous.get(uid) == hashes[uid] and os.path.exists(path):
+                result["unchanged"].append(uid)
+                continue
+            self.__write(path, self.render_module(uid, group))
+            result["written"].append(uid)
+        for uid, old_path in previous_paths.items():
+            if paths.get(uid) != old_path:  # Removed, or moved by a new exporter version
+                try:
+                    os.remove(os.path.join(self.directory, old_path))
+                except OSError:
+                    pass
+                if uid not in groups:
+                    result["removed"].append(uid)
+        # Manifests of older exporter versions record no module paths
+        result["removed"].extend(uid for uid in previous if uid not in groups and uid not in previous_paths)
+
+        revision = hashlib.sha256("".join(sorted(hashes.values())).encode("ascii")).hexdigest()
+        manifest = {"revision": revision, "roots": [BUNDLE_ROOT],
+                    "metadata": {"exporter": EXPORTER_VERSION, "policies": hashes, "modules": paths}}
+        self.__write(self.__manifest_path(), json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+        return result
@@ -1,13 +1,65 @@
+import hashlib
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 
 from .Interfaces import TranslatorInterface
 from .Parsers import ODRLParser
-from .Policy import Rule
+from .Constraint import ArithmeticConstraint
+from .Policy import Rule, term_iri
 from .PolicyEnforcement import PolicyEnforcement
-from .Refinables import PartyCollection, AssetCollection
+from .ConjunctiveQuery import is_contained, query_target
+from .PolicyIR import PolicyCompiler, RuleIR, Relation, Membership, Comparison, QueryAtom, Variable, RULE_ID, RULE_KINDS, \
+    policy_fingerprint, translation_cache
+from .RegoBundle import RegoBundleExporter
+from .Vocabulary import ClassHierarchy, get_vocabulary
 from .ontology import *
 
 
+def _render_term(term, rule: RuleIR) -> str:
+    """
+    Renders a term of a compiled rule.
+
+    :param term: RULE_ID, a Variable, a verbatim string, or a tuple of those.
+    :param rule: RuleIR the term belongs to.
+    :return: The rendered term, e.g. "x12" for Variable(2) of a rule at base 10.
+    """
+    if isinstance(term, Variable):
+        return f"x{rule.base + term.index}"
+    if term is RULE_ID:
+        return rule.id
+    if isinstance(term, tuple):
+        return ",".join(_render_term(t, rule) for t in term)
+    return str(term)
+
+
+# Operator tables keyed on the local name, so "eq", "odrl:eq" and the full IRI all resolve
+LOGIC_OPERATORS = {
+    "eq": "=",
+    "gt": ">",
+    "gteq": "≥",
+    "hasPart": "has part",
+    "isA": "is a",
+    "isAllOf": "∧",
+    "isAnyOf": "∨",
+    "isNoneOf": "¬",
+    "isPartOf": "is part of",
+    "lt": "<",
+    "lteq": "≤",
+    "neq": "≠"
+}
+
+REGO_OPERATORS = {
+    "eq": "==",
+    "gt": ">",
+    "gteq": ">=",
+    "lt": "<",
+    "lteq": "<=",
+    "neq": "!="
+}
+
 
 class LogicTranslator():
     def __init__(self):
@@ -18,166 +70,87 @@ class LogicTranslator():
         self.actorTypes = get_actors_from_dpv()
         self.purposeTypes = get_purposes_from_dpv()
 
-    def __check(self, i,list):
-        if isinstance(i,str):
-            pass
-        elif type(i) is type([]):
-            i = i[0].source
-        else:
-            i = i.source
-        for a in list:
-            if a["label"].lower() == i.lower() or a["uri"].lower() == i.lower():
-                return True
-    def __get(self, i, list):
-        if isinstance(i,str):
-            pass
-        elif type(i) is type([]):
-            i = i[0].source
-        else:
-            i = i.source
-
-        for a in list:
-            if a["label"].lower() == i.lower() or a["uri"].lower() == i.lower():
-                return a["label"].replace(" ","")
-
-    def __extract_constraints_logic(self, x1,x2, constraint):
-        logic_expression = ""
+    def __get_formal_logic_operator(self, name):
+        return LOGIC_OPERATORS.get(name, "Unknown")
 
-        try:
-            lo = constraint.leftOperand.split("/")[-1].split("#")[-1]
-            ro = constraint.rightOperand.split("/")[-1].split("#")[-1]
-            op = constraint.operator
-            if lo == "purpose" or constraint.operator.split("/")[-1].split("#")[-1] == "isA":
-                logic_expression += f"has{lo.capitalize()} ({x1},x{x2}) {self.conjunction} {ro}(x{x2}) {self.conjunction} "
-            else:
-                logic_expression += f"has{lo.capitalize()} ({x1},x{x2}) {self.conjunction} x{x2} {self.__get_formal_logic_operator(op)} {ro} {self.conjunction} "
-        except BaseException as b:
-            if constraint.logic_and is not None:
-                for a in constraint.logic_and:
-                    lo = a['leftOperand'].split("/")[-1].split("#")[-1]
-                    ro = a['rightOperand'].split("/")[-1].split("#")[-1]
-                    op = a['operator']
-                    if lo == "purpose" or constraint.operator.split("/")[-1].split("#")[-1] == "isA":
-                        logic_expression += f"has{lo.capitalize()} ({x1},x{x2}) {self.conjunction} {ro}(x{x2}) {self.conjunction} "
-                    else:
-                        logic_expression += f"has{lo.capitalize()} ({x1},x{x2}) {self.conjunction} x{x2} {self.__get_formal_logic_operator(op)} {ro} {self.conjunction} "
-        return logic_expression
-    def __get_formal_logic_operator(self, uri):
-        operators = {
-            "http://www.w3.org/ns/odrl/2/eq": "=",
-            "http://www.w3.org/ns/odrl/2/gt": ">",
-            "http://www.w3.org/ns/odrl/2/gteq": "≥",
-            "http://www.w3.org/ns/odrl/2/hasPart": "has part",
-            "http://www.w3.org/ns/odrl/2/isA": "is a",
-            "http://www.w3.org/ns/odrl/2/isAllOf": "∧",
-            "http://www.w3.org/ns/odrl/2/isAnyOf": "∨",
-            "http://www.w3.org/ns/odrl/2/isNoneOf": "¬",
-            "http://www.w3.org/ns/odrl/2/isPartOf": "is part of",
-            "http://www.w3.org/ns/odrl/2/lt": "<",
-            "http://www.w3.org/ns/odrl/2/lteq": "≤",
-            "http://www.w3.org/ns/odrl/2/neq": "≠"
-        }
-        return operators.get(uri, "Unknown")
     def __extract_logic_expressions_from_file(self, file = "./Examples/consent.odrl"):
         policies = self.odrl.parse_file(file)
         return self.translate_policy(policies)
+
     def translate_policy(self, policies: []):
+        return list(self.translate_policy_iter(policies))
+
+    def translate_policy_iter(self, policies):
+        """
+        Translates policies lazily, yielding one formal logic expression per rule.
 
-        logic_list = []
-
-        x = 0
-        for p in policies:
-            #results = []
-            i = 1
-            for r in p.prohibition:
-                i, x, lst = self.__parse_rule("Prohibition", r, i, x, logic_list)
-                logic_list = lst
-            for r in p.permission:
-                i, x, lst = self.__parse_rule("Permission", r, i, x, logic_list)
-                logic_list = lst
-            for r in p.obligation:
-                i, x, lst = self.__parse_rule("Obligation", r, i, x, logic_list)
-                logic_list = lst
-                #results.append({"uid":id,"rule":logic_expression})
-
-        return logic_list
-
-    def __parse_rule(self, type: str, rule: object, i: int, x: int, logic_list: []):
+        :param policies: Iterable of parsed Policy objects.
+        :return: Generator of expressions, in the order translate_policy returns them.
+        """
+        for rule in PolicyCompiler(get_vocabulary(), translation_cache).iter_compile(policies):
+            yield self.render_rule(rule)
+
+    def translate_policy_ir(self, policies) -> list:
+        """
+        Translates policies into structured expressions instead of strings.
+
+        :param policies: Iterable of parsed Policy objects.
+        :return: List of RuleIR, the conjunction of Relation, Membership, Comparison and QueryAtom
+                 objects each expression of translate_policy is rendered from.
+        """
+        return PolicyCompiler(get_vocabulary(), translation_cache).compile(policies)
+
+    def translate_policy_symbolic(self, policies) -> list:
+        """
+        Translates policies into sympy Boolean expressions.
+
+        Every atom becomes a sympy Symbol named like its rendering in translate_policy, and every
+        rule the And of its atoms, so the result can be passed to sympy's satisfiable() directly.
+        sympy is only imported when this method is used.
+
+        :param policies: Iterable of parsed Policy objects.
+        :return: List of sympy expressions, one per rule.
+        """
         try:
-            logic_op = self.conjunction
-            id = f"{type[:2]}{i}"
-            logic_expression = f"{type}({id}) {logic_op} "
-            query = ""
-            i += 1
-
-            for c in rule.constraint:
-                try:
-                    if c.leftOperand == "ex:query":
-                        query = c.rightOperand
-                except:
-                    pass
-            if query == "":
-                if isinstance(rule.target, str):
-                    query = rule.target
-                else:
-                    query = rule.target.source
-            # query = proh.target
-            query_parts = query.split(":-")
-            if len(query_parts) > 1:
-                id = query.split("(")[0]
-
-                inputs = query_parts[0].split("(")[1].replace(")", "")
-
-                pattern = r'Table\d+\([^)]+\)'
-                tables = re.findall(pattern, query_parts[1])
-
-                logic_expression += f"hasTarget({id}, {inputs})  {logic_op} "
-                for table in tables:
-                    logic_expression += f"{table.strip()}  {logic_op} "
-            else:
-                target = query.split("/")[-1].split("#")[-1]
-                #                    logic_expression += f"hasTarget({id}, {target})  {logic_op} "
-                logic_expression += f"hasTarget ({id},x{x}) {logic_op} {target} (x{x}) {logic_op} "
-                if isinstance(rule.target, AssetCollection):
-                    x_temp = x
-                    for ref in rule.target.refinement:
-                        logic_expression += self.__extract_constraints_logic(f'x{x_temp}', x+1, ref)
-                        x += 1
-                x += 1
-
-            if self.__check(rule.assignee, self.actorTypes):
-                function_name = self.__get(rule.assignee, self.actorTypes)
-                logic_expression += f"hasActor ({id},x{x}) {logic_op} {function_name} (x{x}) {logic_op} "
-                if isinstance(rule.assignee, PartyCollection):
-                    for ref in rule.assignee.refinement:
-                        x_temp = x
-                        logic_expression += self.__extract_constraints_logic(f'x{x_temp}', x + 1, ref)
-                        x += 1
-                        # logic_expression += f"has{ref.other['leftOperand']} (x{x}, y{x}) {logic_op} y{x} {get_formal_logic_operator(ref.other['operator'])} {ref.other['rightOperand']} {logic_op} "
-                x += 1
-            if self.__check(rule.action, self.actionTypes):
-                function_name = self.__get(rule.action, self.actionTypes)
-                logic_expression += f"hasAction ({id},x{x}) {logic_op} {function_name} (x{x}) {logic_op} "
-                if not isinstance(rule.action, str):
-                    for ref in rule.action[0].refinement:
-                        x_temp = x
-                        logic_expression += self.__extract_constraints_logic(f'x{x_temp}', x + 1, ref)
-                        x += 1
-                x += 1
-            for c in rule.constraint:
-                logic_expression += self.__extract_constraints_logic(id, x, c)
-                # if c.logic_and:
-                #     pass
-                # if check(c.rightOperand, purposeTypes):
-                #     function_name = get(c.rightOperand, purposeTypes)
-                #     logic_expression += f"hasPurpose ({id},x{x}) {logic_op} {function_name} (x{x}) {logic_op} "
-                x += 1
-            logic_expression = logic_expression[:-2]
-            logic_list.append(logic_expression)
-        except BaseException as b:
-            print(b)
-            pass
-        return i, x, logic_list
+            from sympy import And, Symbol
+        except ImportError as e:
+            raise ImportError("translate_policy_symbolic requires sympy (pip install sympy)") from e
+        expressions = []
+        for rule in self.translate_policy_ir(policies):
+            head = Symbol(f"{rule.kind}({rule.id})")
+            expressions.append(And(head, *(Symbol(self.__render_atom(atom, rule)) for atom in rule.body)))
+        return expressions
+
+    def render_rules(self, rules: list) -> list:
+        """
+        Renders compiled rules as formal logic expressions.
+
+        :param rules: RuleIR objects, e.g. from PolicyCompiler.compile.
+        :return: List of expressions, one per rule.
+        """
+        return [self.render_rule(rule) for rule in rules]
+
+    def render_rule(self, rule: RuleIR) -> str:
+        """
+        Renders one compiled rule as a formal logic expression.
+
+        :param rule: RuleIR instance.
+        :return: Conjunction of the rule's atoms, e.g. "Permission(Pe1) ∧ hasTarget (Pe1,x0) ∧ ...".
+        """
+        parts = [f"{rule.kind}({rule.id})"]
+        parts.extend(self.__render_atom(atom, rule) for atom in rule.body)
+        return f" {self.conjunction} ".join(parts)
+
+    def __render_atom(self, atom, rule):
+        if isinstance(atom, Relation):
+            return f"has{atom.name.capitalize()} ({_render_term(atom.subject, rule)},{_render_term(atom.object, rule)})"
+        if isinstance(atom, Membership):
+            return f"{atom.class_name} ({_render_term(atom.variable, rule)})"
+        if isinstance(atom, Comparison):
+            return f"{_render_term(atom.variable, rule)} {self.__get_formal_logic_operator(atom.operator)} {atom.value}"
+        if isinstance(atom, QueryAtom):
+            return f"{atom.predicate}({_render_term(atom.args, rule)})"
+        return str(atom)
 
 class RegoTranslator():
     def __init__(self):
@@ -188,145 +161,301 @@ class RegoTranslator():
         self.actorTypes = get_actors_from_dpv()
         self.purposeTypes = get_purposes_from_dpv()
 
-    def __check(self, i, lst):
-        if isinstance(i, str):
-            pass
-        elif isinstance(i, list):
-            i = i[0].source
-        else:
-            i = i.source
-        for a in lst:
-            if a["label"].lower() == i.lower() or a["uri"].lower() == i.lower():
-                return True
-
-    def __get(self, i, lst):
-        if isinstance(i, str):
-            pass
-        elif isinstance(i, list):
-            i = i[0].source
-        else:
-            i = i.source
-        for a in lst:
-            if a["label"].lower() == i.lower() or a["uri"].lower() == i.lower():
-                return a["label"].replace(" ", "")
-
-    def __extract_constraints_rego(self, x1, x2, constraint):
-        rego_expression = ""
-        try:
-            lo = constraint.leftOperand.split("/")[-1].split("#")[-1]
-            ro = constraint.rightOperand.split("/")[-1].split("#")[-1]
-            op = self.__get_formal_rego_operator(constraint.operator)
-            if lo == "purpose" or constraint.operator.split("/")[-1].split("#")[-1] == "isA":
-                rego_expression += f"has_{lo}({x1}, x{x2}) {ro}(x{x2}) "
-            else:
-                rego_expression += f"has_{lo}({x1}, x{x2}) {op} {ro} "
-        except:
-            if constraint.logic_and is not None:
-                for a in constraint.logic_and:
-                    lo = a['leftOperand'].split("/")[-1].split("#")[-1]
-                    ro = a['rightOperand'].split("/")[-1].split("#")[-1]
-                    op = self.__get_formal_rego_operator(a['operator'])
-                    if lo == "purpose" or a['operator'].split("/")[-1].split("#")[-1] == "isA":
-                        rego_expression += f"has_{lo}({x1}, x{x2}) {ro}(x{x2}) "
-                    else:
-                        rego_expression += f"has_{lo}({x1}, x{x2}) {op} {ro} "
-        return rego_expression
-
-    def __get_formal_rego_operator(self, uri):
-        operators = {
-            "http://www.w3.org/ns/odrl/2/eq": "==",
-            "http://www.w3.org/ns/odrl/2/gt": ">",
-            "http://www.w3.org/ns/odrl/2/gteq": ">=",
-            "http://www.w3.org/ns/odrl/2/lt": "<",
-            "http://www.w3.org/ns/odrl/2/lteq": "<=",
-            "http://www.w3.org/ns/odrl/2/neq": "!="
-        }
-        return operators.get(uri, "Unknown")
+    def __get_formal_rego_operator(self, name):
+        return REGO_OPERATORS.get(name, "Unknown")
+
+    def export_bundle(self, policies, directory: str) -> dict:
+        """
+        Exports policies as a loadable OPA bundle, rewriting only the modules whose policies changed.
+
+        :param policies: Parsed Policy objects.
+        :param directory: Bundle directory.
+        :return: Dictionary with the policy uids "written", "unchanged" and "removed".
+        """
+        return RegoBundleExporter(directory).export(policies)
 
     def __extract_rego_expressions_from_file(self, file="./Examples/consent.odrl"):
         policies = self.odrl.parse_file(file)
         return self.translate_policy(policies)
 
     def translate_policy(self, policies):
-        rego_list = []
-        x = 0
-        for p in policies:
-            i = 1
-            for r in p.prohibition:
-                i, x, lst = self.__parse_rule("Prohibition", r, i, x, rego_list)
-                rego_list = lst
-            for r in p.permission:
-                i, x, lst = self.__parse_rule("Permission", r, i, x, rego_list)
-                rego_list = lst
-            for r in p.obligation:
-                i, x, lst = self.__parse_rule("Obligation", r, i, x, rego_list)
-                rego_list = lst
-        return rego_list
-
-    def __parse_rule(self, type, rule, i, x, rego_list):
-        try:
-            logic_op = "&&"
-            id = f"{type[:2]}{i}"
-            rego_expression = f"{type}({id}) {{ {logic_op} "
-            query = ""
-            i += 1
-
-            for c in rule.constraint:
-                try:
-                    if c.leftOperand == "ex:query":
-                        query = c.rightOperand
-                except:
-                    pass
-            if query == "":
-                if isinstance(rule.target, str):
-                    query = rule.target
-                else:
-                    query = rule.target.source
-            query_parts = query.split(":-")
-            if len(query_parts) > 1:
-                id = query.split("(")[0]
-                inputs = query_parts[0].split("(")[1].replace(")", "")
-                pattern = r'Table\d+\([^)]+\)'
-                tables = re.findall(pattern, query_parts[1])
-                rego_expression += f"has_target({id}, {inputs}) {logic_op} "
-                for table in tables:
-                    rego_expression += f"{table.strip()} {logic_op} "
-            else:
-                target = query.split("/")[-1].split("#")[-1]
-                rego_expression += f"has_target({id}, x{x}) {logic_op} {target}(x{x}) {logic_op} "
-                if isinstance(rule.target, AssetCollection):
-                    x_temp = x
-                    for ref in rule.target.refinement:
-                        rego_expression += self.__extract_constraints_rego(f'x{x_temp}', x + 1, ref)
-                        x += 1
-                x += 1
-
-            if self.__check(rule.assignee, self.actorTypes):
-                function_name = self.__get(rule.assignee, self.actorTypes)
-                rego_expression += f"has_actor({id}, x{x}) {logic_op} {function_name}(x{x}) {logic_op} "
-                if isinstance(rule.assignee, PartyCollection):
-                    for ref in rule.assignee.refinement:
-                        x_temp = x
-                        rego_expression += self.__extract_constraints_rego(f'x{x_temp}', x + 1, ref)
-                        x += 1
-                x += 1
-
-            if self.__check(rule.action, self.actionTypes):
-                function_name = self.__get(rule.action, self.actionTypes)
-                rego_expression += f"has_action({id}, x{x}) {logic_op} {function_name}(x{x}) {logic_op} "
-                if not isinstance(rule.action, str):
-                    for ref in rule.action[0].refinement:
-                        x_temp = x
-                        rego_expression += self.__extract_constraints_rego(f'x{x_temp}', x + 1, ref)
-                        x += 1
-                x += 1
-
-            for c in rule.constraint:
-                rego_expression += self.__extract_constraints_rego(id, x, c)
-                x += 1
-            rego_expression = rego_expression[:-4] + "}"
-            rego_list.append(rego_expression)
-        except BaseException as b:
-            print(b)
-            pass
-        return i, x, rego_list
+        return list(self.translate_policy_iter(policies))
+
+    def translate_policy_iter(self, policies):
+        """
+        Translates policies lazily, yielding one Rego rule per rule.
+
+        :param policies: Iterable of parsed Policy objects.
+        :return: Generator of Rego rules, in the order translate_policy returns them.
+        """
+        for rule in PolicyCompiler(get_vocabulary(), translation_cache).iter_compile(policies):
+            yield self.render_rule(rule)
+
+    def render_rules(self, rules: list) -> list:
+        """
+        Renders compiled rules as Rego rules.
+
+        :param rules: RuleIR objects, e.g. from PolicyCompiler.compile.
+        :return: List of Rego rules, one per rule.
+        """
+        return [self.render_rule(rule) for rule in rules]
+
+    def render_rule(self, rule: RuleIR) -> str:
+        """
+        Renders one compiled rule as a Rego rule.
+
+        :param rule: RuleIR instance.
+        :return: Rule with the atoms joined by "&&", e.g. "Permission(Pe1) { has_target(Pe1, x0) && ... }".
+        """
+        body = " && ".join(self.__render_atom(atom, rule) for atom in rule.body)
+        return f"{rule.kind}({rule.id}) {{ {body} }}"
+
+    def __render_atom(self, atom, rule):
+        if isinstance(atom, Relation):
+            return f"has_{atom.name}({_render_term(atom.subject, rule)}, {_render_term(atom.object, rule)})"
+        if isinstance(atom, Membership):
+            return f"{atom.class_name}({_render_term(atom.variable, rule)})"
+        if isinstance(atom, Comparison):
+            return f"{_render_term(atom.variable, rule)} {self.__get_formal_rego_operator(atom.operator)} {atom.value}"
+        if isinstance(atom, QueryAtom):
+            return f"{atom.predicate}({_render_term(atom.args, rule)})"
+        return str(atom)
+
+
+_MISSING = object()
+
+
+class PythonTranslator():
+    def __init__(self, max_versions: int = 32):
+        """
+        Initializes a PythonTranslator, which compiles policies into a native Python decision function.
+
+        The generated decide(action, target, assigner, assignee=None, context=None) answers like
+        PolicyEnforcement.enforce_policy: "Permitted", "Prohibited" or None. Rule terms are inlined
+        as constants and logical constraints as Python expressions, so a decision neither walks
+        Rule objects nor dispatches on rule kinds. Each arithmetic constraint is applied through
+        its compiled test, so operands are coerced and compared exactly as in enforce_policy.
+        Constraints are only evaluated when a context, a dictionary of left operand (full IRI or
+        local name) -> value, is given; a constraint whose left operand is missing from the
+        context fails.
+
+        :param max_versions: Number of compiled policy set versions kept.
+        """
+        self.max_versions = max_versions
+        self._compiled = OrderedDict()
+        self._lock = threading.Lock()
+
+    def translate_policy(self, policies):
+        """
+        Translates every rule into the Python condition under which it applies.
+
+        :param policies: Parsed Policy objects.
+        :return: List of Python expressions, one per rule, in the order of the other translators.
+        """
+        constants = {}
+        conditions = []
+        for policy in policies:
+            for kind, attribute in RULE_KINDS:
+                for rule in getattr(policy, attribute):
+                    conditions.append(self.__rule_condition(rule, constants, None))
+        return conditions
+
+    def generate_source(self, policies, hierarchy: ClassHierarchy = None, constants: dict = None) -> str:
+        """
+        Generates the source of the decide function of a policy set.
+
+        :param policies: Parsed Policy objects.
+        :param hierarchy: Optional; class hierarchy used to match assignees and actions stated
+                          for a superclass, as in PolicyEnforcement.
+        :param constants: Optional; dictionary that receives the constants the source refers to.
+        :return: Python source defining decide.
+        """
+        constants = {} if constants is None else constants
+        lines = [
+            "def decide(action, target, assigner, assignee=None, context=None):",
+            "    target_query = _query_target(target)",
+            "    action = _request_term(action)",
+            "    target = _request_term(target)",
+            "    assigner = _request_term(assigner)",
+            "    assignee = _request_term(assignee)",
+        ]
+        for attribute, decision in (("permission", "Permitted"), ("prohibition", "Prohibited")):
+            for policy in policies:
+                for rule in getattr(policy, attribute):
+                    lines.append(f"    if {self.__rule_condition(rule, constants, hierarchy)}:")
+                    lines.append(f"        return {decision!r}")
+        lines.append("    return None")
+        return "\n".join(lines) + "\n"
+
+    def compile(self, policies, hierarchy: ClassHierarchy = None):
+        """
+        Returns the decide function of a policy set, compiling it once per policy set version.
+
+        :param policies: Parsed Policy objects.
+        :param hierarchy: Optional; class hierarchy used to match assignees and actions.
+        :return: decide(action, target, assigner, assignee=None, context=None) function.
+        """
+        version = hashlib.sha256("".join(policy_fingerprint(p) for p in policies).encode("ascii")).hexdigest()
+        # The hierarchy itself, not its id(): the key keeps it alive, so a new one cannot reuse the address
+        key = (version, hierarchy)
+        with self._lock:
+            decide = self._compiled.get(key)
+            if decide is not None:
+                self._compiled.move_to_end(key)
+                return decide
+
+        constants = {}
+        source = self.generate_source(policies, hierarchy, constants)
+        namespace = {
+            "_MISSING": _MISSING,
+            "_request_term": term_iri,  # Same normalization as the rule terms
+            "_query_target": query_target,
+            "_is_contained": is_contained,
+            "_is_subclass": hierarchy.is_subclass if hierarchy is not None else None,
+        }
+        namespace.update(constants)
+        exec(compile(source, f"<policy set {version[:12]}>", "exec"), namespace)
+        decide = namespace["decide"]
+        decide.version = version
+        decide.source = source
+
+        with self._lock:
+            self._compiled[key] = decide
+            while len(self._compiled) > self.max_versions:
+                self._compiled.popitem(last=False)
+        return decide
+
+    def __constant(self, value, constants):
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return repr(value)
+        name = f"_c{len(constants)}"
+        constants[name] = value
+        return name
+
+    def __subsumed(self, variable, granted, hierarchy):
+        # granted is a tuple of rule IRIs, inlined as a set literal for the exact test
+        exact = f"{variable} in {{{', '.join(repr(g) for g in granted)}}}" if granted else "False"
+        if hierarchy is None or not granted:
+            return exact
+        return f"({exact} or any(_is_subclass({variable}, g) for g in {granted!r}))"
+
+    def __rule_condition(self, rule, constants, hierarchy):
+        target = term_iri(rule.target)
+        target_test = f"target == {target!r}"
+        if rule.target_query is not None:
+            target_test = (f"({target_test} or (target_query is not None and "
+                           f"_is_contained(target_query, {self.__constant(rule.target_query, constants)})))")
+        tests = [target_test, f"assigner == {term_iri(rule.assigner)!r}"]
+
+        assignee = term_iri(rule.assignee)
+        granted_assignee = (assignee,) if assignee is not None else ()
+        tests.append(f"(assignee is None or {self.__subsumed('assignee', granted_assignee, hierarchy)})")
+        granted_actions = tuple(term_iri(a) for a in rule.actions())
+        tests.append(self.__subsumed("action", granted_actions, hierarchy))
+
+        conditions = [self.__constraint_condition(c, constants) for c in rule.constraint
+                      if hasattr(c, "satisfied_by") and getattr(c, "leftOperand", None) != "ex:query"]
+        if conditions:
+            tests.append(f"(context is None or ({' and '.join(conditions)}))")
+        return " and ".join(tests)
+
+    def __comparison(self, constraint, constants):
+        # The operator and right operand were resolved by ArithmeticConstraint.compile; the
+        # generated code only looks up the value, as satisfied_by does, and applies the test
+        check = self.__constant(constraint.check_constraint, constants)
+        lookup = (f"context.get({constraint.leftOperand!r}, "
+                  f"context.get({constraint.left_name!r}, _MISSING))")
+        return f"((v := {lookup}) is not _MISSING and {check}({constraint.leftOperand!r}, v))"
+
+    def __constraint_condition(self, constraint, constants):
+        if isinstance(constraint, ArithmeticConstraint):
+            return self.__comparison(constraint, constants)
+        parts = [self.__constraint_condition(member, constants) for member in constraint.constraints]
+        if constraint.operator in ("and", "andSequence"):
+            return f"({' and '.join(parts)})" if parts else "True"
+        if constraint.operator == "or" and parts:
+            return f"({' or '.join(parts)})"
+        if constraint.operator == "xone" and parts:
+            # A tuple rather than a generator: the parts assign v, which a comprehension iterable cannot
+            return f"(sum(({', '.join(f'bool({part})' for part in parts)},)) == 1)"
+        return "False"
+
+
+_batch_compiler = None
+_batch_translators = ()
+
+
+class _RelativeBase:
+    # Base of the rules rendered in the workers: Variable(i) renders as "x\0i\0", which the parent re-bases
+    def __add__(self, index):
+        return f"\0{index}\0"
+
+
+_RELATIVE_BASE = _RelativeBase()
+_RELATIVE_VARIABLE = re.compile(r"x\0(\d+)\0")
+
+
+def _init_batch_worker(translators):
+    # Runs once per worker process: load the vocabulary a single time for every policy it translates
+    global _batch_compiler, _batch_translators
+    _batch_compiler = PolicyCompiler(get_vocabulary(), translation_cache)
+    _batch_translators = translators
+
+
+def _translate_batch_policy(policy):
+    rendered = []
+    for rule in _batch_compiler.compile_policy(policy):
+        placed = rule.at(_RELATIVE_BASE)
+        rendered.append((rule.base, rule.span, tuple(t.render_rule(placed) for t in _batch_translators)))
+    return rendered
+
+
+class BatchTranslator():
+    def __init__(self, translators: list, max_workers: int = None, chunksize: int = 16):
+        """
+        Initializes a BatchTranslator, which translates large policy corpora on a process pool.
+
+        Policies are compiled and rendered in the worker processes, each of which loads the
+        vocabulary once. The expressions come back in input order with rule-relative variables,
+        which this process re-bases, so the output and the running x numbering are exactly
+        those of translate_policy.
+
+        :param translators: Translators whose render_rule produces the output, e.g. [LogicTranslator()].
+        :param max_workers: Optional; number of worker processes, by default the number of CPUs.
+        :param chunksize: Number of policies sent to a worker at a time.
+        """
+        self.translators = translators
+        self.max_workers = max_workers
+        self.chunksize = chunksize
+        self.last_stats = None
+
+    def translate(self, policies: list) -> list:
+        """
+        Translates policies with every translator.
+
+        :param policies: Parsed Policy objects.
+        :return: One list of expressions per translator, in the order of self.translators.
+        """
+        start = time.perf_counter()
+        results = [[] for _ in self.translators]
+        rule_count = 0
+        base = 0
+        with ProcessPoolExecutor(max_workers=self.max_workers, initializer=_init_batch_worker,
+                                 initargs=(tuple(self.translators),)) as executor:
+            for rendered in executor.map(_translate_batch_policy, policies, chunksize=self.chunksize):
+                for rule_base, span, rule_expressions in rendered:
+                    offset = base + rule_base
+                    rebase = lambda match: f"x{offset + int(match.group(1))}"
+                    for expression, expressions in zip(rule_expressions, results):
+                        expressions.append(_RELATIVE_VARIABLE.sub(rebase, expression))
+                    rule_count += 1
+                if rendered:
+                    base += rendered[-1][0] + rendered[-1][1]
+        seconds = time.perf_counter() - start
+        self.last_stats = {
+            "policies": len(policies),
+            "rules": rule_count,
+            "seconds": seconds,
+            "rules_per_second": rule_count / seconds if seconds > 0 else 0.0,
+        }
+        return results
@@ -0,0 +1,285 @@
+"""
+Hash-indexed views over the ODRL and DPV vocabularies used by the translators.
+"""
+import logging
+import os
+import threading
+
+try:
+    from .ontology import OntologyRegistry, registry
+except ImportError:  # Imported as a top-level module, e.g. by raise_policy_checking_api.py
+    from ontology import OntologyRegistry, registry
+
+logger = logging.getLogger(__name__)
+
+
+class VocabularyEntry:
+    __slots__ = ("uri", "label", "name")
+
+    def __init__(self, uri: str, label: str):
+        """
+        Initializes a VocabularyEntry instance.
+
+        :param uri: IRI of the vocabulary term.
+        :param label: rdfs:label of the vocabulary term.
+        """
+        self.uri = uri
+        self.label = label
+        self.name = label.replace(" ", "")  # Display name used as a predicate by the translators
+
+    def __repr__(self):
+        return f"VocabularyEntry({self.uri!r}, {self.label!r})"
+
+
+class VocabularyIndex:
+    def __init__(self, entries: list):
+        """
+        Initializes a VocabularyIndex from a list of {"uri": ..., "label": ...} dictionaries.
+
+        Labels and URIs are lower-cased once and stored as dictionary keys, so a lookup is a single
+        hash probe. When several entries share a key the first one wins, like the linear scans the
+        index replaces.
+
+        :param entries: Vocabulary table as returned by the ontology helpers.
+        """
+        self.entries = [VocabularyEntry(e["uri"], e["label"]) for e in entries]
+        self._by_key = {}
+        for entry in self.entries:
+            self._by_key.setdefault(entry.label.lower(), entry)
+            self._by_key.setdefault(entry.uri.lower(), entry)
+
+    def lookup(self, term: str):
+        """
+        Finds the entry whose label or URI matches the term, ignoring case.
+
+        :param term: Label or URI to look up.
+        :return: The matching VocabularyEntry, or None.
+        """
+        if term is None:
+            return None
+        return self._by_key.get(term.lower())
+
+    def __contains__(self, term):
+        return self.lookup(term) is not None
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class ClassHierarchy:
+    def __init__(self, edges: list):
+        """
+        Initializes a ClassHierarchy with its transitive closure materialized.
+
+        Every class gets a dense integer id and an ancestor bitset (a Python int with bit n set
+        when class n is the class itself or one of its superclasses), so a subsumption check is a
+        single shift-and-mask instead of an rdfs:subClassOf* traversal.
+
+        :param edges: List of direct (subclass IRI, superclass IRI) pairs.
+        """
+        self.iris = []
+        self._ids = {}
+        parents = []
+        for sub, sup in edges:
+            sub_id = self.__intern(sub, parents)
+            sup_id = self.__intern(sup, parents)
+            if sub_id != sup_id:
+                parents[sub_id].append(sup_id)
+
+        self._ancestors = [0] * len(self.iris)
+        done = [False] * len(self.iris)
+        for class_id in range(len(self.iris)):
+            if done[class_id]:
+                continue
+            # Iterative post-order walk; a class already on the stack (a cycle) contributes its own bit only
+            stack = [(class_id, iter(parents[class_id]))]
+            on_stack = {class_id}
+            while stack:
+                node, remaining = stack[-1]
+                parent = next(remaining, None)
+                if parent is None:
+                    bits = 1 << node
+                    for p in parents[node]:
+                        bits |= self._ancestors[p] if done[p] else 1 << p
+                    self._ancestors[node] = bits
+                    done[node] = True
+                    on_stack.discard(node)
+                    stack.pop()
+                elif not done[parent] and parent not in on_stack:
+                    on_stack.add(parent)
+                    stack.append((parent, iter(parents[parent])))
+
+    def __intern(self, iri, parents):
+        class_id = self._ids.get(iri)
+        if class_id is None:
+            class_id = self._ids[iri] = len(self.iris)
+            self.iris.append(iri)
+            parents.append([])
+        return class_id
+
+    def id(self, iri: str):
+        """
+        Returns the integer id of a class.
+
+        :param iri: IRI of the class.
+        :return: The class id, or None if the class is not part of the hierarchy.
+        """
+        return self._ids.get(iri)
+
+    def is_subclass(self, sub: str, sup: str) -> bool:
+        """
+        Checks whether a class is the same as, or a (transitive) subclass of, another class.
+
+        :param sub: IRI of the candidate subclass.
+        :param sup: IRI of the candidate superclass.
+        :return: True if sub is subsumed by sup, False otherwise.
+        """
+        if sub == sup:
+            return True
+        sub_id = self._ids.get(sub)
+        sup_id = self._ids.get(sup)
+        if sub_id is None or sup_id is None:
+            return False
+        return (self._ancestors[sub_id] >> sup_id) & 1 == 1
+
+    def ancestors(self, iri: str) -> list:
+        """
+        Returns a class and all of its superclasses.
+
+        :param iri: IRI of the class.
+        :return: List of IRIs, empty if the class is not part of the hierarchy.
+        """
+        class_id = self._ids.get(iri)
+        if class_id is None:
+            return []
+        bits = self._ancestors[class_id]
+        return [self.iris[i] for i in range(bits.bit_length()) if (bits >> i) & 1]
+
+    def __len__(self):
+        return len(self.iris)
+
+
+class Vocabulary:
+    def __init__(self, tables: dict, hierarchy_edges: list = None, version: str = None):
+        """
+        Initializes a Vocabulary holding one VocabularyIndex per vocabulary table.
+
+        A Vocabulary is never modified after construction; a new ontology release produces a new
+        Vocabulary that replaces the old one as a whole.
+
+        :param tables: Dictionary of table name -> list of {"uri": ..., "label": ...} dictionaries.
+        :param hierarchy_edges: Optional; direct (subclass, superclass) pairs of the class hierarchies.
+        :param version: Optional; ontology hash the tables were extracted for.
+        """
+        self.version = version
+        self.actions = VocabularyIndex(tables["actions"])
+        self.actors = VocabularyIndex(tables["actors"])
+        self.purposes = VocabularyIndex(tables["purposes"])
+        self.left_operands = VocabularyIndex(tables["left_operands"])
+        self.operators = VocabularyIndex(tables["operators"])
+        self.hierarchy = ClassHierarchy(hierarchy_edges or [])
+
+
+class VocabularySnapshots:
+    def __init__(self, ontology_registry: OntologyRegistry, poll_interval: float = 5.0):
+        """
+        Initializes a VocabularySnapshots manager.
+
+        The manager publishes the current Vocabulary through a single attribute. Rebuilding after an
+        ontology update happens off to the side, and the finished Vocabulary is swapped in with one
+        assignment (read-copy-update): readers never block on a rebuild and never see a half-built
+        index, and a reader that already holds a snapshot keeps using it until it is done.
+
+        :param ontology_registry: Registry the vocabulary tables are loaded from.
+        :param poll_interval: Seconds between two checks of the ontology directory by watch().
+        """
+        self.registry = ontology_registry
+        self.poll_interval = poll_interval
+        self._current = None
+        self._build_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def current(self) -> Vocabulary:
+        """
+        Returns the current Vocabulary snapshot, building the first one synchronously.
+
+        :return: Shared Vocabulary instance.
+        """
+        current = self._current
+        if current is None:
+            self.refresh()
+            current = self._current
+        return current
+
+    def refresh(self) -> bool:
+        """
+        Rebuilds the Vocabulary if the ontology files changed and swaps it in.
+
+        :return: True if a new snapshot was published, False if the current one is up to date.
+        """
+        with self._build_lock:
+            rows = self.registry.load()
+            current = self._current
+            if current is not None and current.version == rows.version:
+                return False
+            self._current = Vocabulary(rows.tables, rows.hierarchy, rows.version)
+            return True
+
+    def __directory_stamp(self):
+        directory = os.path.dirname(self.registry.file_paths()["dpv"])
+        return tuple(sorted((entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                            for entry in os.scandir(directory) if entry.is_file()))
+
+    def watch(self):
+        """
+        Starts a daemon thread that polls the ontology directory and refreshes on changes.
+        """
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self.__watch, name="vocabulary-snapshots", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        """
+        Stops the watcher thread started by watch().
+        """
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def __watch(self):
+        stamp = None
+        while not self._stop.is_set():
+            try:
+                new_stamp = self.__directory_stamp()
+                if new_stamp != stamp:
+                    self.refresh()
+                    stamp = new_stamp
+            except Exception:
+                # A release being copied in may be incomplete; keep serving the current snapshot and retry
+                logger.exception("Vocabulary refresh failed")
+            self._stop.wait(self.poll_interval)
+
+
+snapshots = VocabularySnapshots(registry)
+
+
+def get_vocabulary() -> Vocabulary:
+    """
+    Returns the current process-wide Vocabulary snapshot.
+
+    :return: Shared Vocabulary instance.
+    """
+    return snapshots.current()
+
+
+def get_class_hierarchy() -> ClassHierarchy:
+    """
+    Returns the materialized DPV and ODRL class hierarchy of the process-wide Vocabulary.
+
+    :return: Shared ClassHierarchy instance.
+    """
+    return get_vocabulary().hierarchy
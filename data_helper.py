@@ -9,13 +9,130 @@
 # tort, or otherwise, arising from, out of, or in connection with the
 # software or the use or other dealings in the software.
 # -----------------------------------------------------------------------------
+import hashlib
 import os
+import re
+import tempfile
+import threading
 import time
 import uuid
+import weakref
+from collections import OrderedDict
+from itertools import product
 from telnetlib import EC
 
-from owlready2 import owl, default_world
-from rdflib import Graph, Namespace
+from owlready2 import owl, World
+from rdflib import Graph, Literal, Namespace
+from rdflib.namespace import OWL, RDF, RDFS
+
+# Directory holding the SQLite quadstores of the pooled owlready2 worlds
+WORLD_CACHE_DIR = os.path.join(tempfile.gettempdir(), "policy_engine_worlds")
+
+
+class OntologyWorldPool:
+    def __init__(self, cache_dir=WORLD_CACHE_DIR, max_worlds=16):
+        """
+        Initializes an OntologyWorldPool.
+
+        Each ontology file version, identified by its path and modification time, gets its own
+        owlready2 World backed by an on-disk SQLite quadstore. Repeated reads reuse the loaded
+        World, and a restarted process reopens the quadstore instead of parsing the OWL file again.
+        Editing the file changes its modification time, which retires the old World.
+
+        Callers may keep using an ontology after its World left the pool, so the pool never closes
+        a World on its own: retired Worlds stay open until release() or clear() is called.
+
+        :param cache_dir: Directory for the SQLite quadstores.
+        :param max_worlds: Maximum number of Worlds kept in the pool; the least recently used one
+                           is retired first.
+        """
+        self.cache_dir = cache_dir
+        self.max_worlds = max_worlds
+        self._ontologies = OrderedDict()
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def __quadstore_path(self, key):
+        digest = hashlib.sha1(f"{key[0]}:{key[1]}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.sqlite3")
+
+    def __retire(self, key, ontology, stale):
+        # Left open: callers may still hold the ontology or entities of its World
+        self._retired[id(ontology)] = (key, ontology, stale)
+
+    def __close(self, key, ontology, remove):
+        ontology.world.close()
+        if remove:
+            try:
+                os.remove(self.__quadstore_path(key))
+            except OSError:
+                pass
+
+    def get_ontology(self, ontology_path):
+        """
+        Returns the loaded ontology for a file, loading it into a new pooled World if needed.
+
+        :param ontology_path: Path of the OWL/RDF file.
+        :type ontology_path: str
+        :return: ontology
+        :rtype: owlready2.Ontology
+        """
+        path = os.path.abspath(ontology_path)
+        key = (path, os.stat(path).st_mtime_ns)
+        with self._lock:
+            ontology = self._ontologies.get(key)
+            if ontology is not None:
+                self._ontologies.move_to_end(key)
+                return ontology
+            for stale_key in [k for k in self._ontologies if k[0] == path]:
+                self.__retire(stale_key, self._ontologies.pop(stale_key), stale=True)
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            world = World(filename=self.__quadstore_path(key), exclusive=False)
+            ontology = world.get_ontology(path).load()
+            world.save()
+            self._ontologies[key] = ontology
+            while len(self._ontologies) > self.max_worlds:
+                old_key, old_ontology = self._ontologies.popitem(last=False)
+                self.__retire(old_key, old_ontology, stale=False)
+            return ontology
+
+    def release(self, ontology):
+        """
+        Closes the World of an ontology once the caller is done with it and everything loaded
+        from it. A World of an outdated file version also has its quadstore removed.
+
+        :param ontology: Ontology returned by get_ontology.
+        :type ontology: owlready2.Ontology
+        """
+        with self._lock:
+            retired = self._retired.pop(id(ontology), None)
+            if retired is not None:
+                key, _, stale = retired
+            else:
+                key = next((k for k, o in self._ontologies.items() if o is ontology), None)
+                if key is None:
+                    return
+                del self._ontologies[key]
+                stale = False
+            self.__close(key, ontology, remove=stale)
+
+    def clear(self):
+        """
+        Closes every World of the pool, including retired ones; ontologies returned before must
+        not be used afterwards.
+        """
+        with self._lock:
+            while self._ontologies:
+                key, ontology = self._ontologies.popitem(last=False)
+                self.__close(key, ontology, remove=False)
+            for key, ontology, stale in self._retired.values():
+                self.__close(key, ontology, remove=stale)
+            self._retired.clear()
+
+
+world_pool = OntologyWorldPool()
+
 
 def use_case_ontology_classes(ontology_file):
     """Returns the list of classes from the ontology
@@ -65,20 +182,43 @@ def use_case_ontology_classes(ontology_file):
           ]
         }
     """
-    thing_subclass = {}
-    read_ontology(ontology_file)
-    for cls in list(owl.Thing.subclasses()):
-        subitems = [
-            prettyfy(str(item), False)
-            for item in list(cls.subclasses())
-            if (len(list(cls.subclasses())) > 0)
-        ]
-        thing_subclass[prettyfy(str(cls), False)] = subitems
-    return thing_subclass
+    thing_subclass = class_tree_index(read_ontology(ontology_file)).thing_subclasses
+    return {name: list(subitems) for name, subitems in thing_subclass.items()}
+
+
+# Directory ontology file names are resolved against
+MEDIA_ROOT = os.environ.get("MEDIA_ROOT", "")
+
+
+def ontology_classes_dict(ontology):
+    """Returns the classes of an ontology by name
+    :param ontology: Ontology in owl/rdf format
+    :type ontology: owlready2.Ontology
+    :return: class name -> class
+    :rtype: dict
+    """
+    return {cls.name: cls for cls in ontology.classes()}
+
+
+def prettyfy(name, split_words=True):
+    """Returns the display name of an ontology entity, e.g. "Exercise" for "fitness.Exercise"
+    :param name: entity name, optionally prefixed with its ontology name
+    :type name: str
+    :param split_words: whether to split camel case into words, e.g. "Clean And Jerk"
+    :type split_words: bool
+    :return: display name
+    :rtype: str
+    """
+    name = name.rsplit(".", 1)[-1]
+    if split_words:
+        name = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", name)
+    return name
 
 
 def read_ontology(ontology_file, world=None):
     """Reads the ontology file and returns the ontology
+    Without an explicit world the ontology comes from the shared world pool, so repeated reads of
+    an unchanged file do not parse it again.
     :param ontology_file: ontology file
     :type ontology_file: str
     :param world: world
@@ -89,28 +229,121 @@ def read_ontology(ontology_file, world=None):
     ontology_file = str(os.path.relpath(ontology_file))
     if world is not None:
         ontology = world.get_ontology(
-            os.path.join(settings.MEDIA_ROOT, str(ontology_file))
+            os.path.join(MEDIA_ROOT, str(ontology_file))
         ).load()
         if ontology_classes_dict(ontology):
             ontology.destroy()
             ontology = world.get_ontology(
-                os.path.join(settings.MEDIA_ROOT, str(ontology_file))
+                os.path.join(MEDIA_ROOT, str(ontology_file))
             ).load()
     else:
-        ontology = default_world.get_ontology(
-            os.path.join(settings.MEDIA_ROOT, str(ontology_file))
-        ).load()
-        if ontology_classes_dict(ontology):
-            try:
-                ontology.destroy()
-            except Exception as e:
-                print(f"Ontology classes: {(ontology, e)}")
-            ontology = default_world.get_ontology(
-                os.path.join(settings.MEDIA_ROOT, str(ontology_file))
-            ).load()
+        ontology = world_pool.get_ontology(
+            os.path.join(MEDIA_ROOT, str(ontology_file))
+        )
     return ontology
 
 
+class OntologyClassIndex:
+    def __init__(self, ontology):
+        """
+        Initializes an OntologyClassIndex, the class tree of one ontology version.
+
+        The parent -> children adjacency and the display names are computed once; the dict trees
+        and leaf lists built from them are memoized per (root, first class, second class).
+
+        :param ontology: Ontology in owl/rdf format
+        :type ontology: owlready2.Ontology
+        """
+        self.version = ontology.graph.get_last_update_time()
+        self.classes = dict(ontology_classes_dict(ontology))
+        self.names = {}
+        self.children = {}
+        top_classes = list(owl.Thing.subclasses(world=ontology.world))
+        for cls in top_classes + list(self.classes.values()):
+            self.__name(cls)
+            self.__subclasses(cls)
+        self.thing_subclasses = {
+            self.names[cls]: [self.names[item] for item in self.children[cls]] for cls in top_classes
+        }
+        self._trees = {}
+        self._leaves = {}
+
+    def __name(self, cls):
+        name = self.names.get(cls)
+        if name is None:
+            name = self.names[cls] = prettyfy(str(cls), False)
+        return name
+
+    def __subclasses(self, cls):
+        children = self.children.get(cls)
+        if children is None:
+            children = self.children[cls] = list(cls.subclasses())
+            for child in children:
+                self.__name(child)
+        return children
+
+    def dict_tree(self, root, class_first_name=None, class_second_name=None):
+        """Returns the dict tree of ontology_data_to_dict_tree from the index
+        The returned tree is shared between callers and must not be modified.
+        :return: tree of purposes
+        :rtype: dict
+        """
+        key = (root, class_first_name, class_second_name)
+        tree = self._trees.get(key)
+        if tree is not None:
+            return tree
+        combined_data = []
+        if class_first_name is not None:
+            combined_data += self.__subclasses(self.classes[class_first_name])
+        if class_second_name is not None:
+            combined_data += self.__subclasses(self.classes[class_second_name])
+
+        if not combined_data:
+            tree = {}
+        else:
+            root_node = MakeTree(self.__name(self.classes[root]))
+            for cls in combined_data:
+                root_child = MakeTree(self.names[cls])
+                root_node.children.append(root_child)
+                for childcls in self.__subclasses(cls):
+                    root_child.children.append(MakeTree(self.names[childcls]))
+            tree = tree_to_dict(root_node)
+        self._trees[key] = tree
+        return tree
+
+    def leaf_node_names(self, root, class_first_name=None, class_second_name=None):
+        """Returns the leaf node names of a dict tree, as get_leaf_node_names does
+        :return: leaf node names
+        :rtype: list
+        """
+        key = (root, class_first_name, class_second_name)
+        leaves = self._leaves.get(key)
+        if leaves is None:
+            tree = self.dict_tree(root, class_first_name, class_second_name)
+            leaves = self._leaves[key] = get_leaf_node_names(tree) if tree else []
+        return leaves
+
+
+_class_tree_indexes = weakref.WeakKeyDictionary()
+_class_tree_lock = threading.Lock()
+
+
+def class_tree_index(ontology):
+    """Returns the class tree index of an ontology, rebuilding it when the ontology changed
+    :param ontology: Ontology in owl/rdf format
+    :type ontology: owlready2.Ontology
+    :return: class tree index
+    :rtype: OntologyClassIndex
+    """
+    index = _class_tree_indexes.get(ontology)
+    if index is None or index.version != ontology.graph.get_last_update_time():
+        with _class_tree_lock:
+            index = _class_tree_indexes.get(ontology)
+            if index is None or index.version != ontology.graph.get_last_update_time():
+                index = _class_tree_indexes[ontology] = OntologyClassIndex(ontology)
+    return index
+
+
 class MakeTree:
     def __init__(self, data):
         self.data = data
@@ -139,32 +372,10 @@ def ontology_data_to_dict_tree(
     :return: tree of purposes
     :rtype: dict
     """
-    class_a = []
-    class_b = []
-
     if root is None:
         return {"error": "Root class is not defined"}
 
-    if class_first_name is not None:
-        class_a = list(ontology_classes_dict(ontology)[class_first_name].subclasses())
-    if class_second_name is not None:
-        class_b = list(ontology_classes_dict(ontology)[class_second_name].subclasses())
-
-    combined_data = class_a + class_b
-
-    if not combined_data:
-        return {}
-
-    root = MakeTree(prettyfy(str(ontology_classes_dict(ontology)[root]), False))
-    for cls in combined_data:
-        root_child = MakeTree(prettyfy(str(cls), False))
-        root.children.append(root_child)
-        root_child_has_subclasses = list(cls.subclasses())
-        if root_child_has_subclasses:
-            for childcls in root_child_has_subclasses:
-                root_child.children.append(MakeTree(prettyfy(str(childcls), False)))
-    dict_tree = tree_to_dict(root)
-    return dict_tree
+    return class_tree_index(ontology).dict_tree(root, class_first_name, class_second_name)
 
 
 def get_leaf_node_names(node):
@@ -203,44 +414,108 @@ def get_leaf_node_names(node):
             leaf_node_names.extend(get_leaf_node_names(child))
         return leaf_node_names
 
-def get_fields_from_datasets(dataset,ttl_file_path):
-    # Parse TTL content
-    g = Graph()
-    g.parse(ttl_file_path, format="ttl")
-
-
-    # Define namespaces
-    # odrl = Namespace("http://www.w3.org/ns/odrl/2/#")
-
-    # Query actions
-    actions_query = f"""
-        PREFIX ex: <http://example.org/datasets/>
-        PREFIX rdf: <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-
-        SELECT ?columnName ?columnType ?columnDescription ?columnExample
-        WHERE {{
-            <{dataset}> rdf:type ex:Dataset ;
-                ex:hasColumn [ rdf:type ex:Column ;
-                               ex:columnName ?columnName ;
-                               ex:columnDataType ?columnType ;
-                               ex:columnDescription ?columnDescription ;
-                               ex:columnExample ?columnExample ] .
-        }}
+class DatasetCatalogue:
+    def __init__(self, ttl_file_path):
+        """
+        Initializes a DatasetCatalogue, the prebuilt lookup maps of one dataset catalogue file version.
+
+        The file is parsed once and its triples are walked once to fill the dataset -> columns,
+        dataset -> title and class -> datatype properties maps, so the lookups run no SPARQL.
+
+        :param ttl_file_path: Path of the catalogue in Turtle format.
+        :type ttl_file_path: str
+        """
+        stat = os.stat(ttl_file_path)
+        self.version = (stat.st_mtime_ns, stat.st_size)
+        g = Graph()
+        g.parse(ttl_file_path, format="turtle")
+
+        self.titles = []
+        self.columns = {}
+        for dataset in g.subjects(RDF.type, CATALOGUE_NAMESPACES["ex"].Dataset):
+            for title in g.objects(dataset, CATALOGUE_NAMESPACES["dct"].title):
+                self.titles.append({"uri": str(dataset), "label": str(title)})
+            self.columns[str(dataset)] = self.__columns(g, dataset)
+
+        self.class_properties = {}
+        for prop in g.subjects(RDF.type, OWL.DatatypeProperty):
+            labels = [str(label) for label in g.objects(prop, RDFS.label)]
+            for domain in g.objects(prop, RDFS.domain):
+                self.class_properties.setdefault(str(domain), []).extend(
+                    {"uri": str(prop), "label": label} for label in labels
+                )
+
+    @staticmethod
+    def __columns(g, dataset):
+        ex = CATALOGUE_NAMESPACES["ex"]
+        fields = []
+        for column in g.objects(dataset, ex.hasColumn):
+            if (column, RDF.type, ex.Column) not in g:
+                continue
+            # One row per combination of values, like the SPARQL pattern this replaces
+            for name, data_type, description, example in product(
+                    g.objects(column, ex.columnName), g.objects(column, ex.columnDataType),
+                    g.objects(column, ex.columnDescription), g.objects(column, ex.columnExample)):
+                fields.append({"columnName": _term_value(name), "columnType": _term_value(data_type),
+                               "columnDescription": _term_value(description),
+                               "columnExample": _term_value(example)})
+        return fields
+
+    def properties_of(self, class_uri):
+        """Returns the datatype properties whose rdfs:domain is a class
+        :param class_uri: IRI of the class, or a compact IRI with a catalogue prefix
+        :type class_uri: str
+        :return: list of {"uri": ..., "label": ...}
+        :rtype: list
+        """
+        if "/" not in class_uri:
+            prefix, separator, rest = class_uri.partition(":")
+            if separator and prefix in CATALOGUE_NAMESPACES:
+                class_uri = str(CATALOGUE_NAMESPACES[prefix]) + rest
+        return self.class_properties.get(class_uri, [])
+
+
+# Prefixes the catalogue queries were written against
+CATALOGUE_NAMESPACES = {
+    "ex": Namespace("http://example.org/datasets/"),
+    "dct": Namespace("http://purl.org/dc/terms/"),
+    "dpv": Namespace("https://w3id.org/dpv/dpv-owl##"),
+    "cc": Namespace("http://creativecommons.org/ns#"),
+    "odrl": Namespace("http://www.w3.org/ns/odrl/2/"),
+    "rdfs": Namespace(str(RDFS)),
+    "owl": Namespace(str(OWL)),
+}
+
+
+def _term_value(term):
+    return term.value if isinstance(term, Literal) else term
+
+
+_dataset_catalogues = {}
+_dataset_catalogue_lock = threading.Lock()
+
+
+def dataset_catalogue(ttl_file_path):
+    """Returns the catalogue index of a Turtle file, rebuilding it when the file changed
+    :param ttl_file_path: Path of the catalogue in Turtle format
+    :type ttl_file_path: str
+    :return: catalogue index
+    :rtype: DatasetCatalogue
     """
-#     actions_query = """
-#     SELECT *
-#     WHERE {
-# ?s ?p ?o
-#     }
-#         """
-
-    fields = [
-        {"columnName": row.columnName.value,"columnType": row.columnType.value,"columnDescription": row.columnDescription.value,"columnExample": row.columnExample.value}
-        for row in g.query(actions_query)
-    ]
+    path = os.path.abspath(str(ttl_file_path))
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    catalogue = _dataset_catalogues.get(path)
+    if catalogue is None or catalogue.version != version:
+        with _dataset_catalogue_lock:
+            catalogue = _dataset_catalogues.get(path)
+            if catalogue is None or catalogue.version != version:
+                catalogue = _dataset_catalogues[path] = DatasetCatalogue(path)
+    return catalogue
 
-    return fields
+
+def get_fields_from_datasets(dataset,ttl_file_path):
+    return list(dataset_catalogue(ttl_file_path).columns.get(str(dataset), []))
 
 def get_actions_from_ttl(ttl_file_path):
     # Load the TTL file into an RDF graph
@@ -407,31 +682,7 @@ def get_constraints_types_from_odrl(ttl_file_path):
 
 
 def get_dataset_titles_and_uris(ttl_file_path):
-    # Load the TTL file into an RDF graph
-    g = Graph()
-    g.parse(ttl_file_path, format="turtle")
-
-    # Define the relevant namespaces
-    ex = Namespace("http://example.org/datasets/")
-    dct = Namespace("http://purl.org/dc/terms/")
-
-    # Query for dataset titles and URIs
-    query = """
-    SELECT ?dataset ?title
-    WHERE {
-      ?dataset rdf:type ex:Dataset ;
-               dct:title ?title .
-    }
-    """
-
-    # Execute the query
-    result = g.query(query, initNs={"ex": ex, "dct": dct})
-
-    # Extract and return the list of dataset titles and URIs
-    dataset_info_list = [
-        {"uri": str(dataset), "label": str(title)} for dataset, title in result
-    ]
-    return dataset_info_list
+    return list(dataset_catalogue(ttl_file_path).titles)
 
 
 def get_actions_from_odrl(ttl_file_path):
@@ -484,31 +735,7 @@ def get_operators_from_odrl(ttl_file_path):
     return actions
 
 def get_properties_of_a_class(class_uri, ttl_file_path):
-    # Parse TTL content
-    g = Graph()
-    g.parse(str(ttl_file_path), format="ttl")
-    if "/" in class_uri:
-        class_uri = "<" + class_uri + ">"
-    properties_query = f"""
-        PREFIX dpv: <https://w3id.org/dpv/dpv-owl##>
-        PREFIX cc: <http://creativecommons.org/ns#>
-        PREFIX odrl: <http://www.w3.org/ns/odrl/2/>
-        PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-        PREFIX owl: <http://www.w3.org/2002/07/owl#>
-
-        SELECT ?property ?label
-        WHERE {{
-          ?property rdf:type owl:DatatypeProperty ;
-                    rdfs:domain {class_uri} ;
-                    rdfs:label ?label .
-        }}
-    """
-    properties2 = list(g.query("select * where {?s ?p ?o}"))
-    properties = [
-        {"uri": str(row.property), "label": str(row.label)}
-        for row in g.query(properties_query)
-    ]
-    return properties
+    return list(dataset_catalogue(ttl_file_path).properties_of(class_uri))
 
 
 
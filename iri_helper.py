@@ -0,0 +1,146 @@
+"""
+IRI prefix, local-name and interning helpers shared by the policy model, the translators and
+constraint evaluation.
+
+Results are cached, so hot paths that see the same IRIs for every rule stop re-splitting strings,
+and the interner turns IRIs into dense integer ids so matching is integer comparison.
+"""
+import sys
+import threading
+from functools import lru_cache
+
+# Known namespaces by prefix
+PREFIXES = {
+    "odrl": "http://www.w3.org/ns/odrl/2/",
+    "dpv": "https://w3id.org/dpv/dpv-owl#",
+    "ex": "http://example.org/datasets/",
+}
+
+# Interned prefix ids; 0 is reserved for IRIs outside the known namespaces
+PREFIX_IDS = {prefix: i for i, prefix in enumerate(PREFIXES, start=1)}
+
+# Longest namespace first, so a namespace nested in another one wins
+_NAMESPACES = sorted(((namespace, prefix) for prefix, namespace in PREFIXES.items()), key=lambda n: -len(n[0]))
+
+
+@lru_cache(maxsize=65536)
+def split_iri(iri: str) -> tuple:
+    """
+    Splits an IRI into the interned id of its known prefix and the remainder.
+
+    :param iri: Full IRI or compact IRI.
+    :return: (prefix id, local part); the prefix id is 0 and the local part the whole IRI when
+             the IRI is not in a known namespace.
+    """
+    for namespace, prefix in _NAMESPACES:
+        if iri.startswith(namespace):
+            return PREFIX_IDS[prefix], iri[len(namespace):]
+    prefix, separator, rest = iri.partition(":")
+    if separator and prefix in PREFIX_IDS:
+        return PREFIX_IDS[prefix], rest
+    return 0, iri
+
+
+@lru_cache(maxsize=65536)
+def local_name(iri: str) -> str:
+    """
+    Returns the part of an IRI after its known prefix, or else after its last "/" and then its last "#".
+
+    :param iri: Full IRI, compact IRI or plain term.
+    :return: The local name, e.g. "eq" for "http://www.w3.org/ns/odrl/2/eq" and for "odrl:eq".
+    """
+    return split_iri(iri)[1].split("/")[-1].split("#")[-1]
+
+
+@lru_cache(maxsize=65536)
+def expand(curie: str) -> str:
+    """
+    Expands a compact IRI with a known prefix.
+
+    :param curie: Compact IRI such as "dpv:Employee".
+    :return: The full IRI, or the input unchanged if it has no known prefix.
+    """
+    prefix, separator, rest = curie.partition(":")
+    if separator and prefix in PREFIXES and not rest.startswith("//"):
+        return PREFIXES[prefix] + rest
+    return curie
+
+
+class IRIInterner:
+    def __init__(self):
+        """
+        Initializes an IRIInterner, which hands out dense integer ids for IRIs.
+
+        Ids start at 0 and never change for the lifetime of the process, so they can be compared
+        with == and used directly as list or array indexes. Compact IRIs with a known prefix get
+        the same id as their full form.
+        """
+        self.iris = []
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def intern(self, iri: str):
+        """
+        Returns the id of an IRI, assigning a new one if the IRI was not seen before.
+
+        :param iri: IRI or plain term.
+        :return: The integer id, or None for None.
+        """
+        if iri is None:
+            return None
+        iri_id = self._ids.get(iri)
+        if iri_id is not None:
+            return iri_id
+        full = expand(iri)
+        with self._lock:
+            iri_id = self._ids.get(full)
+            if iri_id is None:
+                iri_id = len(self.iris)
+                self.iris.append(sys.intern(full))
+                self._ids[full] = iri_id
+            self._ids[iri] = iri_id
+        return iri_id
+
+    def lookup(self, iri: str):
+        """
+        Returns the id of an IRI without assigning one, for matching request terms against a model.
+
+        :param iri: IRI or plain term.
+        :return: The integer id, None for None, or UNKNOWN_ID if the IRI was never interned.
+        """
+        if iri is None:
+            return None
+        iri_id = self._ids.get(iri)
+        if iri_id is None:
+            iri_id = self._ids.get(expand(iri), UNKNOWN_ID)
+        return iri_id
+
+    def iri(self, iri_id: int):
+        """
+        Returns the IRI of an id.
+
+        :param iri_id: Id returned by intern.
+        :return: The full IRI, or None for None or UNKNOWN_ID.
+        """
+        if iri_id is None or iri_id == UNKNOWN_ID:
+            return None
+        return self.iris[iri_id]
+
+    def __len__(self):
+        return len(self.iris)
+
+
+# Id of a term that was never interned; it never equals the id of a model term
+UNKNOWN_ID = -1
+
+interner = IRIInterner()
+
+
+def iri_id(iri: str):
+    """
+    Interns an IRI in the process-wide interner.
+
+    :param iri: IRI or plain term.
+    :return: The integer id, or None for None.
+    """
+    return interner.intern(iri)
@@ -7,24 +7,45 @@ Contributors:
 
 """
 
-from flask import Flask, request, jsonify
-from Constraint import Constraint
-from Parsers import ODRLParser
-from PolicyEnforcement import PolicyEnforcement
-from ontology import *
-from Translators import extract_logic_expressions as logic_expr
+import importlib
+import json
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+if not __package__:
+    # Run as "python main.py": import this directory as a package, so the relative imports of its modules resolve
+    sys.path.insert(0, os.path.dirname(APP_DIR))
+    __package__ = os.path.basename(APP_DIR)
+    importlib.import_module(__package__)
+
+from flask import Flask, Response, request, jsonify, stream_with_context
+from .Parsers import ODRLParser
+from .PolicyEnforcement import PolicyEnforcement
+from .ontology import *
+from .Vocabulary import snapshots
+from .Translators import LogicTranslator, RegoTranslator
+from .DecisionCache import MISS, DecisionCache, request_key
 app = Flask(__name__)
+# Uploads above this size are rejected with 413 before they are parsed
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("POLICY_ENGINE_MAX_CONTENT_LENGTH", 10 * 1024 * 1024))
 
 # Assuming 'policy.odrl' is the file path
-file_path = "./examples/policy.odrl"
+file_path = os.path.join(APP_DIR, "Examples", "policy.odrl")
 
 odrl = ODRLParser()
 policies = odrl.parse_file(file_path)
 
+# Decisions are reused for this many seconds, so constraints on the current time are re-checked
+decision_ttl = float(os.environ.get("POLICY_ENGINE_DECISION_TTL", 60))
+policy_enforcement = PolicyEnforcement(policies, cache=DecisionCache(ttl=decision_ttl))
+evaluate_cache = DecisionCache(ttl=decision_ttl)
+
 @app.route('/', methods=['GET'])
 def index():
     # Read the content of the HTML file
-    with open('logic.html', 'r') as file:
+    with open(os.path.join(APP_DIR, 'logic.html'), 'r') as file:
         html_content = file.read()
     return html_content
 @app.route('/evaluate_odrl', methods=['POST'])
@@ -43,13 +64,24 @@ def evaluate_odrl():
 
 conjunction = "∧"
 disjunction = "∨"
+translators = {"logic": LogicTranslator(), "rego": RegoTranslator()}
 @app.route('/extract_logic_expressions', methods=['POST'])
 def extract_logic_expressions():
+    """
+    Translates a list of ODRL policies and streams the result as NDJSON, one
+    {"expression": ...} line per rule as soon as it is translated.
+    The optional "format" query parameter selects "logic" (default) or "rego".
+    """
+    translator = translators.get(request.args.get("format", "logic"))
+    if translator is None:
+        return jsonify({"error": f"Unknown format, expected one of {sorted(translators)}"}), 400
+    incoming_request = odrl.parse_list(request.get_json())
+
+    def generate():
+        for expression in translator.translate_policy_iter(incoming_request):
+            yield json.dumps({"expression": expression}, ensure_ascii=False) + "\n"
 
-    incoming_request = odrl.parse_list(request.json)
-    print (incoming_request)
-    result = logic_expr(incoming_request)
-    return result
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
 
 @app.route('/evaluate', methods=['POST'])
@@ -58,6 +90,17 @@ def evaluate():
     target = data['target']
     action = data['action']
     context = data['context']
+    key = request_key(action, target, None, None, context, normalize=False)
+    result = evaluate_cache.get(key) if key is not None else MISS
+    if result is MISS:
+        result = _evaluate(target, action, context)
+        if key is not None:
+            evaluate_cache.put(key, result, evaluate_cache.version)
+    allowed, reason = result
+    return jsonify({"allowed": allowed, "reason": reason} if reason else {"allowed": allowed})
+
+
+def _evaluate(target, action, context):
     permission_found = False
     allowed = True
     reason = ""
@@ -67,12 +110,12 @@ def evaluate():
                 permission_found = True
                 if len(permission.constraint)>0:
                     constraints = permission.constraint if isinstance(permission.constraint, list) else [permission.constraint]
-                    if not Constraint.evaluate(constraints, context):
+                    if not all(constraint.satisfied_by(context) for constraint in constraints):
                         allowed = False
                         reason = "Constraint not satisfied for permission"
                 if allowed:
                     for duty in permission.duty:
-                        if not duty.is_fulfilled(duty, context):
+                        if not all(constraint.satisfied_by(context) for constraint in duty.constraint):
                             allowed = False
                             reason = "Duty not met"
                             break
@@ -82,18 +125,40 @@ def evaluate():
                 if prohibition.target == target and prohibition.action == action:
                     if len(prohibition.constraint)>0:
                         constraints = prohibition.constraint if isinstance(prohibition.constraint, list) else [prohibition.constraint]
-                        # TODO: check constraints
-                        if Constraint.evaluate(constraints, context, "or"):  # Assuming OR logic for prohibition constraints
+                        if any(constraint.satisfied_by(context) for constraint in constraints):  # Assuming OR logic for prohibition constraints
                             allowed = False
                             reason = "Prohibition applies"
                             break
 
-    if not permission_found:
+    if not permission_found and allowed:  # A prohibition that applies is reported even without a permission
         allowed = False
         reason = "No applicable permission found"
 
-    return jsonify({"allowed": allowed, "reason": reason})
+    return allowed, reason
+
+
+@app.route('/decision_cache', methods=['GET'])
+def decision_cache():
+    """
+    Returns the counters of the decision caches, including their hit ratios.
+    """
+    return jsonify({"enforcement": policy_enforcement.cache.stats(), "evaluate": evaluate_cache.stats()})
+
+
+@app.route('/evaluate_many', methods=['POST'])
+def evaluate_many():
+    """
+    Evaluates many requests against the loaded policies in one call.
+    The body is a list of {"action", "target", "assigner", "assignee", "context"} objects, or
+    {"requests": [...]}; the decisions are returned in the same order.
+    """
+    data = request.get_json()
+    requests = data.get("requests") if isinstance(data, dict) else data
+    if not isinstance(requests, list) or not all(isinstance(r, dict) for r in requests):
+        return jsonify({"error": "Expected a list of request objects"}), 400
+    return jsonify({"decisions": policy_enforcement.enforce_many(requests)})
 
 
 if __name__ == '__main__':
+    snapshots.watch()  # Pick up new DPV/ODRL releases dropped into ontology/ without a restart
     app.run(debug=True, host='0.0.0.0', port="8080")
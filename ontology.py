@@ -1,174 +1,412 @@
+import hashlib
+import marshal
 import os
-
-from rdflib import Graph, Namespace
-
-current_folder_path = os.getcwd()
-dpv_file_path = current_folder_path  + "/PolicyEngine/ontology/dpv.rdf"
-odrl_file_path =  current_folder_path  + "/PolicyEngine/ontology/ODRL22.rdf"
-
-def get_rules_from_odrl():
-    ttl_file_path = odrl_file_path
-    # Parse TTL data
-    g = Graph()
-    g.parse(ttl_file_path, format="xml")
-
-    # Define namespace
-    # odrl = Namespace(
-    #     "http://www.w3.org/ns/odrl/2/#"
-    # )  # Replace with the actual namespace
-    # rdfs = Namespace("http://www.w3.org/2000/01/rdf-schema#")
-
-    # Query for subclasses of :Rule
-    subclasses_query = """
+import sys
+import threading
+import time
+
+# The ontology directory ships with the package; POLICY_ENGINE_ONTOLOGY_DIR points workers at another copy
+ontology_directory = os.environ.get(
+    "POLICY_ENGINE_ONTOLOGY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ontology")
+)
+dpv_file_path = os.path.join(ontology_directory, "dpv.rdf")
+odrl_file_path = os.path.join(ontology_directory, "ODRL22.rdf")
+vocabulary_cache_file_path = os.path.join(os.path.dirname(ontology_directory), "ontology.cache")
+
+# Bump when the layout of the cache file changes
+VOCABULARY_CACHE_FORMAT = 2
+
+# Vocabulary tables extracted from the ontologies: name -> (ontology, SPARQL query).
+# Every query projects the uri first and the label second.
+VOCABULARY_QUERIES = {
+    "rules": ("odrl", """
         SELECT ?subClass ?label
         WHERE {
           ?subClass rdfs:subClassOf odrl:Rule ;
                     rdfs:label ?label .
         }
-    """
-
-    # Execute the query
-    subclasses_result = g.query(subclasses_query)
-
-    # Convert results to a list of dictionaries
-    result_list = [
-        {"uri": str(row.subClass), "label": str(row.label)} for row in subclasses_result
-    ]
-
-    return result_list
-
-
-def get_actors_from_dpv():
-    ttl_file_path = dpv_file_path
-    g = Graph()
-    g.parse(ttl_file_path, format="xml")
-
-    # dpv = Namespace("https://w3id.org/dpv#")
-    # skos = Namespace("http://www.w3.org/2004/02/skos/core#")
-
-    # Query for subclasses of :Rule
-    subclasses_query = """
+    """),
+    "actors": ("dpv", """
         SELECT ?subClass ?label
         WHERE {
           ?subClass rdfs:subClassOf+ <https://w3id.org/dpv/dpv-owl#LegalEntity> .
           ?subClass rdfs:label ?label .
         }
-    """
-
-    # Execute the query
-    subclasses_result = g.query(subclasses_query)
-
-    # Convert results to a list of dictionaries
-    result_list = [
-        {"uri": str(row.subClass), "label": str(row.label)} for row in subclasses_result
-    ]
-
-    return result_list
-
-
-def get_purposes_from_dpv():
-    ttl_file_path = dpv_file_path
-    # Parse TTL data
-    g = Graph()
-    g.parse(ttl_file_path, format="xml")
-
-    # Define namespace
-    # dpv = Namespace("https://w3id.org/dpv#")  # Replace with the actual namespace
-    # skos = Namespace("http://www.w3.org/2004/02/skos/core#")
-
-    # Query for subclasses of :Rule
-    subclasses_query = """
+    """),
+    "purposes": ("dpv", """
         SELECT ?subClass ?label
         WHERE {
           ?subClass rdfs:subClassOf <https://w3id.org/dpv/dpv-owl#Purpose> .
           ?subClass rdfs:label ?label .
         }
-    """
+    """),
+    "left_operands": ("odrl", """
+        SELECT ?leftoperand ?label
+        WHERE {
+          ?leftoperand a odrl:LeftOperand, owl:NamedIndividual ;
+                    rdfs:label ?label .
+        }
+    """),
+    "actions": ("odrl", """
+    SELECT ?action ?label
+    WHERE {
+        ?action a odrl:Action.
+        ?action rdfs:label ?label.
+    }
+    """),
+    "operators": ("odrl", """
+    SELECT ?action ?label
+    WHERE {
+        ?action a odrl:Operator.
+        ?action rdfs:label ?label.
+    }
+    """),
+}
+
+# Class hierarchy edges: name -> (ontology, SPARQL query) projecting (subclass, superclass).
+# ODRL actions are related through odrl:includedIn rather than rdfs:subClassOf.
+HIERARCHY_QUERIES = {
+    "odrl_hierarchy": ("odrl", """
+    SELECT ?sub ?super
+    WHERE {
+        { ?sub rdfs:subClassOf ?super . } UNION { ?sub odrl:includedIn ?super . }
+        FILTER (isIRI(?sub) && isIRI(?super))
+    }
+    """),
+    "dpv_hierarchy": ("dpv", """
+    SELECT ?sub ?super
+    WHERE {
+        ?sub rdfs:subClassOf ?super .
+        FILTER (isIRI(?sub) && isIRI(?super))
+    }
+    """),
+}
 
-    # Execute the query
-    subclasses_result = g.query(subclasses_query)
 
-    # Convert results to a list of dictionaries
-    result_list = [
-        {"uri": str(row.subClass), "label": str(row.label)} for row in subclasses_result
-    ]
+def ontology_file_paths(directory=None):
+    """
+    Returns the paths of the ontology files in an ontology directory.
 
-    return result_list
+    :param directory: Optional; ontology directory, defaults to ontology_directory.
+    :return: Dictionary of ontology name -> file path.
+    """
+    if directory is None:
+        return {"odrl": odrl_file_path, "dpv": dpv_file_path}
+    return {"odrl": os.path.join(directory, "ODRL22.rdf"), "dpv": os.path.join(directory, "dpv.rdf")}
 
 
-def get_constraints_types_from_odrl():
-    ttl_file_path = odrl_file_path
-    # Parse TTL data
-    g = Graph()
-    g.parse(ttl_file_path, format="xml")
+def ontology_hash(file_paths=None):
+    """
+    Computes the content hash that identifies the current ontology files and vocabulary queries.
 
-    # Query for subclasses of :Rule
-    query = """
-        SELECT ?leftoperand ?label
-        WHERE {
-          ?leftoperand a odrl:LeftOperand, owl:NamedIndividual ;
-                    rdfs:label ?label .
-        }
+    :param file_paths: Optional; dictionary of ontology name -> file path, as from ontology_file_paths.
+    :return: Hex digest over ODRL22.rdf, dpv.rdf and the query definitions.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(VOCABULARY_CACHE_FORMAT).encode())
+    for name, path in sorted((file_paths or ontology_file_paths()).items()):
+        digest.update(name.encode())
+        with open(path, "rb") as file:
+            digest.update(file.read())
+    for name, (source, query) in sorted({**VOCABULARY_QUERIES, **HIERARCHY_QUERIES}.items()):
+        digest.update(f"{name}:{source}:{query}".encode())
+    return digest.hexdigest()
+
+
+def read_vocabulary_cache(key, cache_file_path=None):
     """
+    Loads the precompiled vocabulary tables written by write_vocabulary_cache.
 
-    # Execute the query
-    result = g.query(query)
+    :param key: Expected ontology hash; a cache written for other ontology files is ignored.
+    :param cache_file_path: Optional; path of the cache file.
+    :return: Dictionary of table name -> list of row tuples, or None on a miss.
+    """
+    cache_file_path = cache_file_path or vocabulary_cache_file_path
+    try:
+        with open(cache_file_path, "rb") as file:
+            data = marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(data, dict) or data.get("key") != key or data.get("python") != sys.version_info[:2]:
+        return None
+    return data["tables"]
+
+
+def write_vocabulary_cache(key, tables, cache_file_path=None):
+    """
+    Writes the vocabulary tables to a compact binary cache file.
 
-    # Convert results to a list of dictionaries
-    result_list = [
-        {"uri": str(row.leftoperand), "label": str(row.label)} for row in result
-    ]
+    The file is written to a temporary name and renamed, so concurrent workers never read a
+    partial cache. Failing to write (e.g. a read-only deployment) is not an error.
 
-    return result_list
+    :param key: Ontology hash the tables were extracted for.
+    :param tables: Dictionary of table name -> list of row tuples.
+    :param cache_file_path: Optional; path of the cache file.
+    """
+    cache_file_path = cache_file_path or vocabulary_cache_file_path
+    data = {"key": key, "python": sys.version_info[:2], "tables": tables}
+    temp_path = f"{cache_file_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            marshal.dump(data, file)
+        os.replace(temp_path, cache_file_path)
+    except OSError as e:
+        print(f"Vocabulary cache not written: {e}")
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+def _memory_marker():
+    """Returns a memory reading used to measure how much an ontology load allocated.
+
+    Uses tracemalloc when it is already tracing (exact, but too slow to switch on just for this),
+    otherwise the peak resident set size of the process, which grows by roughly the size of the
+    first graph parsed into it.
+    """
+    import tracemalloc
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is reported in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class VocabularyRows:
+    __slots__ = ("version", "tables", "hierarchy")
+
+    def __init__(self, version: str, tables: dict, hierarchy: list):
+        """
+        Initializes a VocabularyRows instance, one immutable load of the vocabulary tables.
+
+        :param version: Ontology hash the rows were extracted for.
+        :param tables: Dictionary of table name -> list of {"uri": ..., "label": ...} dictionaries.
+        :param hierarchy: List of direct (subclass IRI, superclass IRI) pairs.
+        """
+        self.version = version
+        self.tables = tables
+        self.hierarchy = hierarchy
+
+
+class OntologyRegistry:
+    """
+    Process-wide registry of parsed ontology graphs.
 
-def get_actions_from_odrl():
-    ttl_file_path = odrl_file_path
-    # Parse TTL content
-    g = Graph()
-    g.parse(ttl_file_path, format="xml")
+    Each ontology file is parsed once per process and the resulting rdflib Graph is shared by
+    every caller. Query results are cached as well, so the translators and the helper functions
+    below all read the same lists. Callers must treat the returned lists as read-only.
 
-    # Define namespaces
-    # odrl = Namespace("http://www.w3.org/ns/odrl/2/#")
+    The vocabulary tables are also persisted to an on-disk cache keyed by the ontology hash, so
+    a process started against unchanged ontology files never imports rdflib at all.
 
-    # Query actions
-    actions_query = """
-    SELECT ?action ?label
-    WHERE {
-        ?action a odrl:Action.
-        ?action rdfs:label ?label.
-    }
+    A graph is parsed again when its file changes on disk. The loaded vocabulary is published as
+    a single VocabularyRows object, so readers never observe tables from two ontology versions.
     """
 
-    actions = [
-        {"uri": str(row.action), "label": str(row.label)}
-        for row in g.query(actions_query)
-    ]
+    def __init__(self, directory=None):
+        """
+        Initializes an OntologyRegistry.
+
+        :param directory: Optional; ontology directory, defaults to ontology_directory.
+        """
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._graphs = {}
+        self._results = {}
+        self._stats = {}
+        self._rows = None
+
+    def graph(self, file_path, format="xml"):
+        """
+        Returns the parsed graph of an ontology file, parsing it on first use or after it changed.
+
+        :param file_path: Path of the ontology file.
+        :param format: rdflib parser format of the file.
+        :return: The shared rdflib Graph.
+        """
+        key = os.path.abspath(file_path)
+        status = os.stat(key)
+        stamp = (status.st_mtime_ns, status.st_size)
+        cached = self._graphs.get(key)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        with self._lock:
+            cached = self._graphs.get(key)
+            if cached is not None and cached[0] == stamp:
+                return cached[1]
+            from rdflib import Graph
+
+            memory_before = _memory_marker()
+            started = time.perf_counter()
+            g = Graph()
+            g.parse(key, format=format)
+            elapsed = time.perf_counter() - started
+            memory_after = _memory_marker()
+            self._stats[key] = {
+                "load_seconds": elapsed,
+                "triples": len(g),
+                "memory_bytes": None if memory_before is None else max(memory_after - memory_before, 0),
+            }
+            self._results = {k: v for k, v in self._results.items() if k[0] != key}
+            self._graphs[key] = (stamp, g)
+        return g
+
+    def rows(self, file_path, query):
+        """
+        Runs a SPARQL query projecting two IRIs or literals and caches the result.
+
+        :param file_path: Path of the ontology file to query.
+        :param query: SPARQL query with two projected variables.
+        :return: Shared list of (first, second) string tuples.
+        """
+        g = self.graph(file_path)
+        key = (os.path.abspath(file_path), query)
+        cached = self._results.get(key)
+        if cached is not None and cached[0] is g:
+            return cached[1]
+        with self._lock:
+            result = [(str(row[0]), str(row[1])) for row in g.query(query)]
+            self._results[key] = (g, result)
+        return result
+
+    def select(self, file_path, query):
+        """
+        Runs a SPARQL query selecting (uri, label) pairs.
+
+        :param file_path: Path of the ontology file to query.
+        :param query: SPARQL query whose first two projected variables are the uri and the label.
+        :return: List of {"uri": ..., "label": ...} dictionaries.
+        """
+        return [{"uri": uri, "label": label} for uri, label in self.rows(file_path, query)]
+
+    def file_paths(self):
+        """
+        Returns the paths of the ontology files this registry loads.
+
+        :return: Dictionary of ontology name -> file path.
+        """
+        return ontology_file_paths(self.directory)
+
+    def load(self) -> VocabularyRows:
+        """
+        Loads the vocabulary rows for the ontology files as they currently are on disk.
+
+        Reads the on-disk cache when it matches the ontology hash, otherwise queries the graphs
+        and refreshes the cache. Nothing is reloaded when the hash is unchanged.
+
+        :return: The current VocabularyRows.
+        """
+        paths = self.file_paths()
+        key = ontology_hash(paths)
+        current = self._rows
+        if current is not None and current.version == key:
+            return current
+        with self._lock:
+            current = self._rows
+            if current is not None and current.version == key:
+                return current
+            started = time.perf_counter()
+            cache_file_path = os.path.join(os.path.dirname(os.path.dirname(paths["dpv"])), "ontology.cache")
+            rows = read_vocabulary_cache(key, cache_file_path)
+            source = "cache"
+            if rows is None:
+                rows = {
+                    name: self.rows(paths[ontology], query)
+                    for name, (ontology, query) in {**VOCABULARY_QUERIES, **HIERARCHY_QUERIES}.items()
+                }
+                write_vocabulary_cache(key, rows, cache_file_path)
+                source = "ontology"
+            self._rows = VocabularyRows(
+                key,
+                {name: [{"uri": uri, "label": label} for uri, label in rows[name]] for name in VOCABULARY_QUERIES},
+                [edge for name in HIERARCHY_QUERIES for edge in rows[name]],
+            )
+            self._stats["vocabulary"] = {
+                "load_seconds": time.perf_counter() - started,
+                "source": source,
+                "key": key,
+            }
+            return self._rows
+
+    def current(self) -> VocabularyRows:
+        """
+        Returns the most recently loaded vocabulary rows, loading them on first use.
+
+        :return: The current VocabularyRows.
+        """
+        return self._rows or self.load()
+
+    def tables(self):
+        """
+        Returns every vocabulary table, from the on-disk cache when it matches the ontology files.
+
+        :return: Dictionary of table name -> list of {"uri": ..., "label": ...} dictionaries.
+        """
+        return self.current().tables
+
+    def hierarchy_edges(self):
+        """
+        Returns the direct (subclass, superclass) edges of the DPV and ODRL class hierarchies.
+
+        :return: Shared list of (subclass IRI, superclass IRI) tuples.
+        """
+        return self.current().hierarchy
+
+    def table(self, name):
+        """
+        Returns a single vocabulary table.
+
+        :param name: One of the VOCABULARY_QUERIES names.
+        :return: Shared list of {"uri": ..., "label": ...} dictionaries.
+        """
+        return self.current().tables[name]
+
+    def stats(self):
+        """
+        Reports load time, triple count and memory growth for every ontology parsed so far.
+
+        :return: Dictionary keyed by ontology file path.
+        """
+        with self._lock:
+            return {path: dict(stat) for path, stat in self._stats.items()}
+
+    def clear(self):
+        """
+        Drops every cached graph and query result, forcing the next call to parse again.
+        """
+        with self._lock:
+            self._graphs.clear()
+            self._results.clear()
+            self._stats.clear()
+            self._rows = None
+
+
+registry = OntologyRegistry()
 
-    return actions
 
+def get_rules_from_odrl():
+    return registry.table("rules")
 
-def get_operators_from_odrl():
-    ttl_file_path = odrl_file_path
-    # Parse TTL content
-    g = Graph()
-    g.parse(ttl_file_path, format="xml")
 
-    # Define namespaces
-    # odrl = Namespace("http://www.w3.org/ns/odrl/2/#")
+def get_actors_from_dpv():
+    return registry.table("actors")
+
+
+def get_purposes_from_dpv():
+    return registry.table("purposes")
 
-    # Query actions
-    actions_query = """
-    SELECT ?action ?label
-    WHERE {
-        ?action a odrl:Operator.
-        ?action rdfs:label ?label.
-    }
-    """
 
-    actions = [
-        {"uri": str(row.action), "label": str(row.label)}
-        for row in g.query(actions_query)
-    ]
+def get_constraints_types_from_odrl():
+    return registry.table("left_operands")
+
 
-    return actions
+def get_actions_from_odrl():
+    return registry.table("actions")
 
+
+def get_operators_from_odrl():
+    return registry.table("operators")
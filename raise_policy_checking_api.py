@@ -9,6 +9,9 @@ from rdflib import Graph, BNode
 from rdflib.namespace import Namespace
 from rdflib.plugins.sparql import prepareQuery
 
+from ConjunctiveQuery import target_covered
+from Vocabulary import get_class_hierarchy
+
 app = FastAPI()
 
 # Define the namespaces
@@ -279,8 +282,17 @@ def find_matching_nodes(existing_policy: Graph, request_policy: Graph) -> bool:
 
     existing_non_bnode_parts = extract_non_bnode_parts(existing_results)
     request_non_bnode_parts = extract_non_bnode_parts(request_results)
-    # Find matching nodes
-    matching_nodes = existing_non_blank_nodes.intersection(request_non_blank_nodes)
+    # Find matching nodes. A request row matches an existing row when it targets the same source
+    # (or a query contained in the existing query target) and its action, assignee and purpose are
+    # equal to, or subclasses of, the existing ones.
+    hierarchy = get_class_hierarchy()
+    matching_nodes = {
+        request_row
+        for request_row in request_non_blank_nodes
+        for existing_row in existing_non_blank_nodes
+        if target_covered(str(request_row[2]), str(existing_row[2]))
+        and all(hierarchy.is_subclass(str(request_row[i]), str(existing_row[i])) for i in (0, 1, 3))
+    }
     # Debug output
     print("Existing Results (non-BNode parts):", existing_non_bnode_parts)
     print("Request Results (non-BNode parts):", request_non_bnode_parts)
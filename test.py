@@ -1,6 +1,13 @@
 import json
 import pytest
-from main import app  # Replace 'your_api_file' with the name of your Flask app file
+from .main import app  # Replace 'your_api_file' with the name of your Flask app file
+from . import Constraint
+from .data_helper import class_tree_index, read_ontology, use_case_ontology_classes, world_pool
+from .Parsers import ODRLParser
+from .PolicyEnforcement import PolicyEnforcement
+from .RegoBundle import RegoBundleExporter, package_name
+from .Translators import PythonTranslator
+from .Vocabulary import ClassHierarchy
 
 @pytest.fixture
 def client():
@@ -61,3 +68,158 @@ def test_no_applicable_permission_found(client):
     response = client.post('/evaluate', json=data)
     assert response.status_code == 200
     assert response.json == {"allowed": False, "reason": "No applicable permission found"}
+
+def test_extract_logic_expressions_streams_ndjson(client):
+    """Test that every translated rule is returned as its own NDJSON line."""
+    with open('Examples/request.odrl') as file:
+        data = json.load(file)
+    response = client.post('/extract_logic_expressions', json=data if isinstance(data, list) else [data])
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert lines and all(line["expression"].startswith("Permission(") for line in lines)
+
+
+def test_evaluate_many_returns_decisions_in_order(client):
+    """Test that a batch of requests gets one decision per request, in order."""
+    permitted = {"action": "display", "target": "http://example.com/asset:3333",
+                 "assigner": "http://example.com/user"}
+    unknown = {"action": "display", "target": "http://example.com/unknown",
+               "assigner": "http://example.com/user"}
+    response = client.post('/evaluate_many', json={"requests": [unknown, permitted, unknown]})
+    assert response.status_code == 200
+    assert response.json == {"decisions": [None, "Permitted", None]}
+
+def test_evaluate_reuses_cached_decisions(client):
+    """Test that a repeated request is answered from the decision cache."""
+    data = {
+        "target": "http://example.com/asset:123",
+        "action": "read",
+        "context": {"dateTime": "2023-07-01T12:00:00Z"}
+    }
+    hits = client.get('/decision_cache').json["evaluate"]["hits"]
+    first = client.post('/evaluate', json=data)
+    second = client.post('/evaluate', json=data)
+    assert first.json == second.json
+    assert client.get('/decision_cache').json["evaluate"]["hits"] == hits + 1
+
+TYPED_POLICY = [{
+    "uid": "http://example.com/policy:typed",
+    "@type": "Policy",
+    "permission": [
+        {"target": "http://example.com/asset:1", "action": "read",
+         "constraint": [{"leftOperand": "count", "operator": "odrl:lt",
+                         "rightOperand": {"@value": "1200", "@type": "xsd:integer"}}]},
+        {"target": "http://example.com/asset:2", "action": "read",
+         "constraint": [{"leftOperand": "dateTime", "operator": "gt", "rightOperand": "2024-03-01T00:00:00Z"}]},
+        {"target": "http://example.com/asset:3", "action": "read",
+         "constraint": [{"leftOperand": "purpose", "operator": "isAnyOf", "rightOperand": ["dpv:Marketing", "dpv:Research"]}]},
+        {"target": "http://example.com/asset:4", "action": "read",
+         "constraint": [{"leftOperand": "purpose", "operator": "eq", "rightOperand": "https://w3id.org/dpv#Marketing"}]}
+    ]
+}]
+
+def test_compiled_policies_agree_with_enforce_policy():
+    """Test that the Python and Rego translations compare typed operands like enforce_policy."""
+    policies = ODRLParser().parse_list(TYPED_POLICY)
+    enforcement = PolicyEnforcement(policies)
+    decide = PythonTranslator().compile(policies)
+    contexts = [{}, {"count": 5}, {"count": "1199"}, {"count": 1200}, {"count": "many"},
+                {"dateTime": "2024-03-01T01:00:00+01:00"}, {"dateTime": "2024-03-01T00:00:01Z"},
+                {"purpose": "dpv:Marketing"}, {"purpose": ["dpv:Research", "dpv:Sales"]}, {"purpose": ["dpv:Sales"]},
+                {"purpose": "https://w3id.org/dpv#Marketing"}]
+    for number in range(1, 5):
+        for context in contexts:
+            request = ("read", f"http://example.com/asset:{number}", None, None, context)
+            assert decide(*request) == enforcement.enforce_policy(*request), request
+    assert enforcement.enforce_policy("read", "http://example.com/asset:1", None, None, {"count": "1199"}) == "Permitted"
+
+    module = RegoBundleExporter("unused").render_module(policies[0].uid, policies)
+    assert 'to_number(input.context["count"]) < 1200' in module
+    assert 'time.parse_rfc3339_ns(input.context["dateTime"]) > 1709251200000000000' in module
+    assert 'count(_items(input.context["purpose"]) & {"dpv:Marketing", "dpv:Research"}) > 0' in module
+    assert 'input.context["purpose"] == "https://w3id.org/dpv#Marketing"' in module
+
+XONE_POLICY = [{
+    "uid": "http://example.com/policy:xone",
+    "@type": "Policy",
+    "permission": [
+        {"target": "http://example.com/asset:5", "action": "read",
+         "constraint": [{"xone": [{"leftOperand": "count", "operator": "lt", "rightOperand": 10},
+                                  {"leftOperand": "purpose", "operator": "eq", "rightOperand": "dpv:Research"}]}]}
+    ]
+}]
+
+def test_compiled_xone_policy_agrees_with_enforce_policy():
+    """Test that a policy with an xone constraint compiles and decides like enforce_policy."""
+    policies = ODRLParser().parse_list(XONE_POLICY)
+    enforcement = PolicyEnforcement(policies)
+    decide = PythonTranslator().compile(policies)
+    contexts = [{}, {"count": 5}, {"purpose": "dpv:Research"}, {"count": 5, "purpose": "dpv:Research"},
+                {"count": 50, "purpose": "dpv:Sales"}]
+    decisions = []
+    for context in contexts:
+        request = ("read", "http://example.com/asset:5", None, None, context)
+        decisions.append(decide(*request))
+        assert decisions[-1] == enforcement.enforce_policy(*request), request
+    assert decisions == [None, "Permitted", "Permitted", None, None]
+
+def test_subclass_request_terms_no_policy_mentions_are_covered():
+    """Test that a requested subclass is matched through the hierarchy even if no policy mentions it."""
+    hierarchy = ClassHierarchy([("https://w3id.org/dpv/dpv-owl#SubclassOnlyRequestedEmployee", "https://w3id.org/dpv/dpv-owl#LegalEntity"),
+                                ("http://www.w3.org/ns/odrl/2/subclassOnlyRequestedPrint", "http://www.w3.org/ns/odrl/2/use")])
+    policies = ODRLParser().parse_list([{
+        "uid": "http://example.com/policy:hierarchy", "@type": "Policy",
+        "permission": [{"target": "http://example.com/asset:6", "action": "odrl:use", "assignee": "dpv:LegalEntity"}]
+    }])
+    enforcement = PolicyEnforcement(policies, hierarchy)
+    decide = PythonTranslator().compile(policies, hierarchy)
+    request = ("odrl:subclassOnlyRequestedPrint", "http://example.com/asset:6", None, "dpv:SubclassOnlyRequestedEmployee")
+    assert enforcement.enforce_policy(*request) == "Permitted"
+    assert decide(*request) == "Permitted"
+    assert enforcement.enforce_many([{"action": request[0], "target": request[1], "assigner": None,
+                                      "assignee": request[3]}]) == ["Permitted"]
+
+def test_is_a_matches_compact_iris_through_the_hierarchy(monkeypatch):
+    """Test that isA expands compact IRIs on both sides before looking them up in the hierarchy."""
+    hierarchy = ClassHierarchy([("https://w3id.org/dpv/dpv-owl#Employee", "https://w3id.org/dpv/dpv-owl#LegalEntity")])
+    monkeypatch.setattr(Constraint, "get_class_hierarchy", lambda: hierarchy)
+    assert Constraint.OPERATORS["isA"]("dpv:Employee", "dpv:LegalEntity")
+    assert Constraint.OPERATORS["isA"]("https://w3id.org/dpv/dpv-owl#Employee", "dpv:LegalEntity")
+    assert not Constraint.OPERATORS["isA"]("dpv:LegalEntity", "dpv:Employee")
+
+def test_rego_export_keeps_uids_apart_and_skips_unchanged_policies(tmp_path):
+    """Test that similar uids get their own packages and an unchanged policy is not exported again."""
+    assert package_name("p-1") != package_name("p_1")
+    policies = ODRLParser().parse_list([dict(TYPED_POLICY[0], uid="p-1"), dict(TYPED_POLICY[0], uid="p_1")])
+    exporter = RegoBundleExporter(str(tmp_path))
+    assert exporter.export(policies)["written"] == ["p-1", "p_1"]
+    assert exporter.export(policies)["unchanged"] == ["p-1", "p_1"]
+
+SMALL_ONTOLOGY = """<?xml version="1.0"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns:owl="http://www.w3.org/2002/07/owl#"
+         xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#" xml:base="http://example.org/fitness">
+  <owl:Ontology rdf:about="http://example.org/fitness"/>
+  <owl:Class rdf:about="http://example.org/fitness#Exercise"/>
+  <owl:Class rdf:about="http://example.org/fitness#Strength"><rdfs:subClassOf rdf:resource="http://example.org/fitness#Exercise"/></owl:Class>
+  <owl:Class rdf:about="http://example.org/fitness#Squat"><rdfs:subClassOf rdf:resource="http://example.org/fitness#Strength"/></owl:Class>
+  <owl:Class rdf:about="http://example.org/fitness#DifficultyLevel"/>
+</rdf:RDF>
+"""
+
+def test_class_tree_index_builds_on_small_ontology(tmp_path):
+    """Test that the class tree index is built from an OWL file and reused while it is unchanged."""
+    ontology_file = tmp_path / "fitness.owl"
+    ontology_file.write_text(SMALL_ONTOLOGY)
+    ontology = read_ontology(str(ontology_file))
+    try:
+        index = class_tree_index(ontology)
+        assert index.thing_subclasses == {"Exercise": ["Strength"], "DifficultyLevel": []}
+        assert index.dict_tree("Exercise", "Exercise") == {
+            "node_name": "Exercise",
+            "children": [{"node_name": "Strength", "children": [{"node_name": "Squat"}]}]}
+        assert index.leaf_node_names("Exercise", "Exercise") == ["Squat"]
+        assert class_tree_index(ontology) is index
+        assert use_case_ontology_classes(str(ontology_file)) == {"Exercise": ["Strength"], "DifficultyLevel": []}
+    finally:
+        world_pool.release(ontology)